@@ -0,0 +1,45 @@
+"""
+Measures how fast `AthenaParser.execution_plan_extractor` loads large distributed plans.
+
+The `tests/parsers/data/athena/parse` fixtures are scaled up by repeating their fragments, and every plan is loaded
+with the previous `eval` based extractor, as a single string and as the rows returned by the cursor.
+Run with `python benchmarks/athena_plan_loading.py [scale]`.
+"""
+import json
+import pathlib
+import sys
+import time
+
+from query_flow.parsers.athena_parser import AthenaParser
+
+FIXTURES_DIR = pathlib.Path(__file__).parents[1] / 'tests' / 'parsers' / 'data' / 'athena' / 'parse'
+
+
+def scale_plan(plan_text, scale):
+    """Repeats the plan fragments `scale` times, formatted like the Athena output."""
+    execution_plan = AthenaParser().execution_plan_extractor(plan_text)
+    execution_plan['fragments'] = execution_plan['fragments'] * scale
+    return f"{AthenaParser.query_plan_header}\n{json.dumps(execution_plan, indent=2, separators=(',', ' : '))}"
+
+
+def time_loader(loader, plan_text):
+    start = time.perf_counter()
+    loader(plan_text)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    parser = AthenaParser()
+    loaders = {
+        'eval': lambda plan_text: eval(plan_text.replace(AthenaParser.query_plan_header, '')),
+        'string': parser.execution_plan_extractor,
+        'rows': lambda plan_text: parser.execution_plan_extractor(iter(plan_text.splitlines())),
+    }
+
+    print(f"{'plan':>22} {'MB':>7} " + ' '.join(f'{name + " MB/s":>12}' for name in loaders))
+    for plan_path in sorted(FIXTURES_DIR.glob('*.json')):
+        plan_text = scale_plan(plan_path.read_text(), scale)
+        size = len(plan_text) / 2 ** 20
+        throughputs = [size / time_loader(loader, plan_text) for loader in loaders.values()]
+        print(f'{plan_path.name:>22} {size:>7.1f} ' + ' '.join(f'{throughput:>12.1f}' for throughput in throughputs))
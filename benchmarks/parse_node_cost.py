@@ -0,0 +1,83 @@
+"""
+Measures the per-node cost of the parsing hot path, from the execution node to the columnar buffer.
+
+Run with `python benchmarks/parse_node_cost.py`, it reports the best of several runs in microseconds per node, for the
+working tree and for a baseline revision measured on the same plan. The baseline defaults to the revision before the
+per-node hot path was trimmed, pass `--baseline <git ref>` to compare against another one.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import timeit
+
+import numpy as np
+
+DEFAULT_BASELINE = 'a5ac213^'
+
+
+def parse_nodes(parser, execution_plan):
+    parser._cleanup_state()
+    parser.parse_node(execution_plan, target_id=np.nan, query_hash='benchmark')
+
+
+def measure(execution_plan, n_nodes, repeat):
+    from query_flow.parsers.postgres_parser import PostgresParser
+
+    costs = {}
+    for is_compact in [False, True]:
+        parser = PostgresParser(is_compact=is_compact)
+        elapsed = min(timeit.repeat(lambda: parse_nodes(parser, execution_plan), number=1, repeat=repeat))
+        costs[str(is_compact)] = elapsed / n_nodes * 10 ** 6
+    return costs
+
+
+def measure_baseline(baseline, plan_path, n_nodes, repeat):
+    """Measures the same plan with the query_flow package of the baseline revision, in a separate interpreter."""
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as baseline_dir:
+        archive_path = os.path.join(baseline_dir, 'baseline.tar')
+        subprocess.run(['git', 'archive', '-o', archive_path, baseline, 'query_flow'], cwd=repo_root, check=True)
+        with tarfile.open(archive_path) as archive:
+            archive.extractall(baseline_dir)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [baseline_dir, os.environ.get('PYTHONPATH')])))
+        args = [sys.executable, os.path.abspath(__file__), '--plan', plan_path]
+        args += ['--nodes', str(n_nodes), '--repeat', str(repeat)]
+        output = subprocess.run(args, env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='git ref to compare against')
+    arg_parser.add_argument('--nodes', type=int, default=20000)
+    arg_parser.add_argument('--repeat', type=int, default=7)
+    # Internal, measures the plan generated by the working tree and prints the costs as json
+    arg_parser.add_argument('--plan', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.plan:
+        with open(args.plan) as plan_file:
+            execution_plan = json.load(plan_file)
+        print(json.dumps(measure(execution_plan, args.nodes, args.repeat)))
+        sys.exit()
+
+    from query_flow.utils.plan_generator import make_postgres_plan
+
+    execution_plan = make_postgres_plan(args.nodes)
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as plan_file:
+        json.dump(execution_plan, plan_file)
+    try:
+        baseline_costs = measure_baseline(args.baseline, plan_file.name, args.nodes, args.repeat)
+    finally:
+        os.remove(plan_file.name)
+    costs = measure(execution_plan, args.nodes, args.repeat)
+    for is_compact in [False, True]:
+        baseline_cost, cost = baseline_costs[str(is_compact)], costs[str(is_compact)]
+        print(
+            f'is_compact={is_compact}: {cost:.2f} us/node, '
+            f'{args.baseline}: {baseline_cost:.2f} us/node ({baseline_cost / cost:.2f}x)'
+        )
@@ -0,0 +1,27 @@
+"""
+Measures how the node collection phase of `DBParser.parse` scales with the plan size.
+
+Run with `python benchmarks/parse_scaling.py`, the time per node should stay flat as the plans grow.
+"""
+import time
+
+import numpy as np
+
+from query_flow.parsers.postgres_parser import PostgresParser
+from query_flow.utils.plan_generator import make_postgres_plan
+
+
+def time_collection(parser, execution_plan):
+    start = time.perf_counter()
+    parser._cleanup_state()
+    parser.parse_node(execution_plan, target_id=np.nan, query_hash='benchmark')
+    parser._make_flow_df()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = PostgresParser()
+    print(f"{'nodes':>8} {'seconds':>9} {'us/node':>8}")
+    for n_nodes in [1000, 10000, 50000, 100000]:
+        elapsed = time_collection(parser, make_postgres_plan(n_nodes))
+        print(f'{n_nodes:>8} {elapsed:>9.3f} {elapsed / n_nodes * 10 ** 6:>8.1f}')
@@ -0,0 +1,108 @@
+"""
+Benchmarks the parse and visualize pipeline on synthetic Postgres and Athena plans of 10 to 100k operations.
+
+Requires pytest-benchmark and is kept out of the unit tests, run it with `make benchmark`. Every run is saved under
+`benchmarks/results` and compared with the previous one, so saving a run per release (`--benchmark-save=<version>`)
+keeps a history of the pipeline performance.
+"""
+import numpy as np
+import pytest
+
+from query_flow.parsers.athena_parser import AthenaParser
+from query_flow.parsers.db_parser import DBParser
+from query_flow.parsers.postgres_parser import PostgresParser
+from query_flow.utils.plan_generator import make_athena_plan, make_postgres_plan
+from query_flow.vizualizers.query_report import QueryReport
+from query_flow.vizualizers.query_vizualizer import QueryVizualizer
+
+pytest.importorskip('pytest_benchmark')
+
+engines = {
+    'postgres': (PostgresParser, make_postgres_plan, ['actual_rows', 'estimated_cost']),
+    'athena': (AthenaParser, make_athena_plan, ['nodeOutputRows', 'nodeCpuTime']),
+}
+sizes = [10, 1_000, 100_000]
+# The large plans take seconds per round
+rounds = {10: 50, 1_000: 10, 100_000: 3}
+
+
+@pytest.fixture(scope='module', params=sizes, ids=lambda size: f'{size}_nodes')
+def n_nodes(request):
+    return request.param
+
+
+@pytest.fixture(scope='module', params=sorted(engines))
+def engine(request):
+    return request.param
+
+
+@pytest.fixture(scope='module')
+def parser(engine):
+    return engines[engine][0]()
+
+
+@pytest.fixture(scope='module')
+def metrics(engine):
+    return engines[engine][2]
+
+
+@pytest.fixture(scope='module')
+def execution_plan(engine, n_nodes):
+    return engines[engine][1](n_nodes, filter_ratio=0.2, seed=0)
+
+
+@pytest.fixture(scope='module')
+def raw_flow_df(parser, execution_plan):
+    """The flows as collected from the plan, before `align_source_target_ids`."""
+    parser._cleanup_state()
+    for parsed_node in parser.iter_nodes(execution_plan):
+        parser._append_parsed_node(parsed_node)
+    return parser._make_flow_df()
+
+
+@pytest.fixture(scope='module')
+def flow_df(parser, execution_plan):
+    return parser.parse([execution_plan])
+
+
+def test_parse(benchmark, parser, execution_plan, n_nodes):
+    flow_df = benchmark.pedantic(parser.parse, args=([execution_plan],), rounds=rounds[n_nodes])
+
+    assert len(flow_df) >= n_nodes
+
+
+def test_align_source_target_ids(benchmark, raw_flow_df, n_nodes):
+    flow_df = benchmark.pedantic(
+        DBParser.align_source_target_ids, setup=lambda: ((raw_flow_df.copy(),), {}), rounds=rounds[n_nodes]
+    )
+
+    assert np.array_equal(np.sort(flow_df['source'].to_numpy()), np.arange(len(flow_df)))
+
+
+def test_enrich_stats(benchmark, parser, raw_flow_df, n_nodes):
+    aligned_flow_df = DBParser.align_source_target_ids(raw_flow_df.copy())
+    flow_df = benchmark.pedantic(
+        parser.enrich_stats, setup=lambda: ((aligned_flow_df.copy(),), {}), rounds=rounds[n_nodes]
+    )
+
+    assert len(flow_df) == len(raw_flow_df)
+
+
+def test_prepare_dfs_for_sankey(benchmark, parser, flow_df, metrics, n_nodes):
+    vizualizer = QueryVizualizer(parser)
+    sankey_df = benchmark.pedantic(
+        vizualizer._prepare_dfs_for_sankey, setup=lambda: ((flow_df.copy(), metrics), {}), rounds=rounds[n_nodes]
+    )
+
+    assert len(sankey_df) == len(flow_df) * len(metrics)
+
+
+@pytest.mark.parametrize('max_nodes', [None, 200], ids=['all_nodes', 'max_200_nodes'])
+def test_html(benchmark, parser, flow_df, metrics, n_nodes, max_nodes):
+    def to_html():
+        report = QueryReport(QueryVizualizer(parser), title='benchmark')
+        return report.add(flow_df, metrics[:1], 'benchmark', max_nodes=max_nodes).to_html()
+
+    report_html = benchmark.pedantic(to_html, rounds=rounds[n_nodes])
+
+    assert report_html.count('Plotly.newPlot') == 1
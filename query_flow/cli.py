@@ -0,0 +1,186 @@
+"""
+Command line entry point, parses saved execution plans (or explains SQL statements) into a flow frame.
+
+    query-flow 'plans/*.json' --engine postgres --output flows.parquet --html flows.html
+    query-flow --queries queries.sql --con-str postgresql://user@localhost/db --output flows.csv
+
+Progress is logged to stderr. The exit code is 0 when every plan was parsed, 1 when some plans or queries failed
+(the others are still written) and 2 for bad arguments or when nothing could be parsed or written.
+"""
+import argparse
+import glob
+import logging
+import pathlib
+import sys
+import time
+
+import pandas as pd
+
+from query_flow.profiler import parser_factory
+from query_flow.utils.instrumentation import StageMetrics, profile_call
+from query_flow.vizualizers.query_report import QueryReport
+from query_flow.vizualizers.query_vizualizer import QueryVizualizer
+
+__all__ = ['main', 'EXIT_OK', 'EXIT_PARTIAL', 'EXIT_FAILURE']
+
+logger = logging.getLogger(__name__)
+
+EXIT_OK, EXIT_PARTIAL, EXIT_FAILURE = 0, 1, 2
+
+output_writers = {'.parquet': 'to_parquet', '.csv': 'to_csv'}
+default_html_metrics = {'athena': ['nodeOutputRows'], 'postgres': ['actual_rows'], 'postgresql': ['actual_rows']}
+
+
+def make_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog='query-flow', description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('plans', nargs='*', help='plan JSON files, directories of them or glob patterns')
+    arg_parser.add_argument('--queries', type=pathlib.Path, help='a file of `;` separated SQL statements to explain')
+    arg_parser.add_argument('--con-str', help='the connection string to explain the queries with')
+    arg_parser.add_argument('--engine', default='postgres', choices=sorted(default_html_metrics))
+    arg_parser.add_argument('--compact', action='store_true', help='merge identical operations of different queries')
+    arg_parser.add_argument(
+        '--compact-dtypes', action='store_true', help='store repeated strings as categoricals and downcast numbers'
+    )
+    arg_parser.add_argument('--explain-only', action='store_true', help="explain the queries without running them")
+    arg_parser.add_argument('--workers', type=int, help='parse (and query) workers, every core by default')
+    arg_parser.add_argument('-o', '--output', type=pathlib.Path, required=True, help='the flow frame, .parquet or .csv')
+    arg_parser.add_argument('--html', type=pathlib.Path, help='also render the flows into an HTML report')
+    arg_parser.add_argument('--metrics', nargs='+', help='the metrics of the HTML report')
+    arg_parser.add_argument('--min-share', type=float, default=0.0, help='collapse operations under this share')
+    arg_parser.add_argument('--max-nodes', type=int, help='render at most this many operations per diagram')
+    arg_parser.add_argument('--timings', action='store_true', help='print how long every stage took to stderr')
+    arg_parser.add_argument('--profile', type=pathlib.Path, help='write a cProfile of the run (pstats format)')
+    arg_parser.add_argument('-q', '--quiet', action='store_true', help='only log warnings and errors')
+    return arg_parser
+
+
+def main(argv=None):
+    arg_parser = make_arg_parser()
+    args = arg_parser.parse_args(argv)
+    if bool(args.plans) == bool(args.queries):
+        arg_parser.error('pass either plan files or --queries')
+    if args.queries and not args.con_str:
+        arg_parser.error('--queries requires --con-str')
+    if args.output.suffix not in output_writers:
+        arg_parser.error(f'--output should be one of {sorted(output_writers)}')
+    if args.explain_only and args.engine == 'athena':
+        arg_parser.error("athena doesn't support --explain-only")
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format='%(asctime)s %(message)s')
+    if args.output.suffix == '.parquet':
+        try:
+            pd.io.parquet.get_engine('auto')  # Fail before parsing rather than after
+        except ImportError as e:
+            logger.error('Can not write %s: %s', args.output, e)
+            return EXIT_FAILURE
+
+    instrumentation = StageMetrics() if args.timings else None
+    if args.profile:
+        exit_code, profile_stats = profile_call(run, args, instrumentation)
+        profile_stats.dump_stats(args.profile)
+        logger.info('Wrote %s', args.profile)
+    else:
+        exit_code = run(args, instrumentation)
+    if instrumentation is not None:
+        print(instrumentation.to_string(), file=sys.stderr)
+    return exit_code
+
+
+def run(args, instrumentation=None):
+    start = time.perf_counter()
+    parser_kwargs = {
+        'parse_workers': args.workers,
+        'instrumentation': instrumentation,
+        'compact_dtypes': args.compact_dtypes,
+    }
+    with parser_factory(args.engine, '', args.compact, not args.explain_only, **parser_kwargs) as parser:
+        if args.queries:
+            execution_plans, failures = explain_queries(parser, args.queries, args.con_str, args.workers)
+        else:
+            execution_plans, failures = load_plan_files(parser, args.plans)
+        if not execution_plans:
+            logger.error('No execution plans to parse')
+            return EXIT_FAILURE
+
+        logger.info('Parsing %d plans', len(execution_plans))
+        try:
+            flow_df = parser.parse(execution_plans)
+        except Exception:
+            logger.exception('Failed parsing the plans')
+            return EXIT_FAILURE
+
+    try:
+        write_outputs(flow_df, parser, args)
+    except Exception:
+        logger.exception('Failed writing the flows')
+        return EXIT_FAILURE
+
+    logger.info(
+        'Wrote %d flow rows of %d plans in %.1fs, %d failed',
+        len(flow_df),
+        len(execution_plans),
+        time.perf_counter() - start,
+        failures,
+    )
+    return EXIT_PARTIAL if failures else EXIT_OK
+
+
+def find_plan_files(plans):
+    """Expands directories (to their `*.json` files) and glob patterns, returns the files and the unmatched patterns."""
+    plan_paths, unmatched_plans = [], []
+    for plan in plans:
+        plan_path = pathlib.Path(plan)
+        if plan_path.is_dir():
+            plan_paths.extend(sorted(plan_path.glob('*.json')))
+        elif plan_path.is_file():
+            plan_paths.append(plan_path)
+        else:
+            matched_paths = sorted(glob.glob(plan, recursive=True))
+            plan_paths.extend(map(pathlib.Path, matched_paths))
+            if not matched_paths:
+                unmatched_plans.append(plan)
+    return plan_paths, unmatched_plans
+
+
+def load_plan_files(parser, plans):
+    plan_paths, unmatched_plans = find_plan_files(plans)
+    for plan in unmatched_plans:
+        logger.warning('No plan files match %s', plan)
+
+    execution_plans, failures = [], len(unmatched_plans)
+    progress_every = max(1, len(plan_paths) // 10)
+    for position, plan_path in enumerate(plan_paths, 1):
+        try:
+            execution_plan = parser.load_execution_plan(plan_path.read_text())
+            parser.check_execution_plan(execution_plan)
+            execution_plans.append(execution_plan)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            logger.warning('Skipping %s: %s', plan_path, e)
+            failures += 1
+        if position % progress_every == 0 or position == len(plan_paths):
+            logger.info('[%d/%d] Loaded %s', position, len(plan_paths), plan_path)
+    return execution_plans, failures
+
+
+def explain_queries(parser, queries_path, con_str, workers):
+    queries = [query.strip() for query in queries_path.read_text().split(';') if query.strip()]
+    logger.info('Explaining %d queries', len(queries))
+    plan_results = QueryVizualizer(parser).collect_execution_plans(queries, con_str, max_workers=workers or 4)
+    for plan_result in plan_results:
+        if plan_result.error is not None:
+            logger.warning('Skipping %r: %s', plan_result.query, plan_result.error)
+    execution_plans = [plan_result.execution_plan for plan_result in plan_results if plan_result.error is None]
+    return execution_plans, len(plan_results) - len(execution_plans)
+
+
+def write_outputs(flow_df, parser, args):
+    getattr(flow_df, output_writers[args.output.suffix])(args.output, index=False)
+    logger.info('Wrote %s', args.output)
+    if args.html:
+        report = QueryReport(QueryVizualizer(parser), title=args.output.stem)
+        for metric in args.metrics or default_html_metrics[args.engine]:
+            report.add(flow_df, [metric], args.output.stem, min_share=args.min_share, max_nodes=args.max_nodes)
+        logger.info('Wrote %s', report.write(args.html))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,14 @@
+import json
 import logging
 from operator import itemgetter
 
 import numpy as np
-from sqlalchemy.engine import create_engine
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 try:
     from .db_parser import DBParser
@@ -17,10 +23,32 @@ class AthenaParser(DBParser):
     explain_prefix = 'EXPLAIN (FORMAT JSON)'
     explain_analyze_prefix = 'EXPLAIN ANALYZE (FORMAT JSON)'
     query_prefix = None
+    query_plan_header = 'Query Plan'
     next_operator_indicator = 'children'
     last_fragment_id = None
     supported_metrics = frozenset(['nodeCpuTime', 'nodeCpuFraction', 'nodeOutputRows', 'nodeOutputDataSize'])
     redundent_operation_names = frozenset(['Where', 'Filter'])
+    # The cpu fraction is kept as reported, a percentage string
+    categorical_columns = DBParser.categorical_columns | {'nodeCpuFraction'}
+    rows_scales = {'rows': 1.0, 'row': 1.0, '': 1.0}
+    # Data sizes are normalized to MB and cpu times to seconds
+    data_size_scales = {
+        'B': 1.0 / 2 ** 20,
+        'kB': 1.0 / 2 ** 10,
+        'MB': 1.0,
+        'GB': 1.0 * 2 ** 10,
+        'TB': 1.0 * 2 ** 20,
+        'PB': 1.0 * 2 ** 30,
+    }
+    cpu_time_scales = {
+        'ns': 1.0 / 10 ** 9,
+        'us': 1.0 / 10 ** 6,
+        'ms': 1.0 / 10 ** 3,
+        's': 1.0,
+        'm': 1.0 * 60,
+        'h': 1.0 * 60 * 60,
+        'd': 1.0 * 60 * 60 * 24,
+    }
     verbose_ops = {}
 
     description_dict = {
@@ -50,16 +78,41 @@ class AthenaParser(DBParser):
         'Sort': 'Sorts a record set based on the specified sort key.',
     }
 
-    def __init__(self, is_compact=False, execute_query=True):
+    def __init__(self, is_compact=False, execute_query=True, **kwargs):
         self.query_prefix = self.explain_analyze_prefix if execute_query else self.explain_prefix
         assert execute_query, "AthenaParser doesn't support logical plans"
-        super().__init__(is_compact)
+        super().__init__(is_compact, **kwargs)
 
     def node_type_extractor(self, node):
         return node['name'].split('(')[0]
 
-    def execution_plan_extractor(self, node):
-        return eval(node.replace('Query Plan', ''))
+    def execution_plan_extractor(self, execution_plan):
+        """
+        Loads the JSON output of `EXPLAIN ANALYZE (FORMAT JSON)`, either as a single string or as an iterable of its
+        rows' text (e.g. straight from the cursor), skipping the `Query Plan` header.
+        orjson is used when installed, falling back to the standard json module.
+
+        >>> AthenaParser().execution_plan_extractor('Query Plan\\n{"fragments" : [ {"id" : "1"} ]}')
+        {'fragments': [{'id': '1'}]}
+        >>> AthenaParser().execution_plan_extractor(iter(['Query Plan', '{"fragments" :', '[ ]}']))
+        {'fragments': []}
+        """
+        plan_text = '\n'.join(self._iter_plan_lines(execution_plan))
+        return orjson.loads(plan_text) if orjson is not None else json.loads(plan_text)
+
+    def load_execution_plan(self, plan_text):
+        return self.execution_plan_extractor(plan_text)
+
+    def _iter_plan_lines(self, execution_plan):
+        lines = iter([execution_plan] if isinstance(execution_plan, str) else execution_plan)
+        for line in lines:
+            line = line.lstrip()
+            if line:
+                # The header is either a row of its own or the prefix of the whole output
+                header_length = len(self.query_plan_header) if line.startswith(self.query_plan_header) else 0
+                yield line[header_length:]
+                break
+        yield from lines
 
     def filter_indicator(self, node):
         return 'Filtered' in node.get('details', '')
@@ -67,15 +120,13 @@ class AthenaParser(DBParser):
     def normalize_metric(self, metric):
         return metric
 
-    def from_query(self, query, con_str):
-        with create_engine(con_str).connect() as con:
+    def _explain_query(self, query, con_str):
+        with self.get_engine(con_str).connect() as con:
             # SQLALCHEMY doesn't handle % as a regular SQL client so one need to add additional %
             explain_analyze_query = f"{self.query_prefix} {query.replace('%', '%%')}"
 
-            # Grab the execution plan string in case its returned as a multiple rows
-            execution_plan = "\n".join([line[0] for line in con.execute(explain_analyze_query).fetchall()])
-
-            return self.execution_plan_extractor(execution_plan)
+            # The execution plan is returned as multiple rows, which are consumed from the cursor as they are loaded
+            return self.execution_plan_extractor(row[0] for row in con.execute(explain_analyze_query))
 
     @property
     def strategy_dict(self):
@@ -145,35 +196,49 @@ class AthenaParser(DBParser):
 
     @staticmethod
     def normalize_data_size(size_str):
-        scale_dict = {'B': 1.0 / 3 ** 10, '.kB': 1.0 / 2 ** 10, '.MB': 1.0, '.GB': 1.0 * 2 ** 10, '.TB': 1.0 * 2 ** 10}
-        scale = ''.join(i for i in size_str if not i.isdigit())
-        number = float(''.join(i for i in size_str if i.isdigit()))
-
-        return number * scale_dict[scale]
+        """
+        >>> AthenaParser.normalize_data_size('716.14kB')
+        0.69935546875
+        """
+        return AthenaParser.normalize_units(pd.Series([size_str]), AthenaParser.data_size_scales)[0]
 
     @staticmethod
     def normalize_cpu_time(time_str):
-        scale_dict = {'.ns': 1.0 / 3 ** 10, '.ms': 1.0 / 2 ** 10, '.s': 1.0, '.m': 1.0 * 60, '.h': 1.0 * 60 * 60}
-        scale = ''.join(i for i in time_str if not i.isdigit())
-        number = float(''.join(i for i in time_str if i.isdigit()))
-        return number * scale_dict[scale]
-
-    def enrich_stats(self, df):
+        """
+        >>> AthenaParser.normalize_cpu_time('2.50m')
+        150.0
+        """
+        return AthenaParser.normalize_units(pd.Series([time_str]), AthenaParser.cpu_time_scales)[0]
 
-        df['redundent_operation'] = False
-        df['nodeOutputRows'] = df['nodeOutputRows'].map(lambda x: ''.join(i for i in x if i.isdigit()))
-        df['nodeOutputDataSize'] = df['nodeOutputDataSize'].map(AthenaParser.normalize_data_size)
-        df['nodeCpuTime'] = df['nodeCpuTime'].map(AthenaParser.normalize_cpu_time)
+    @staticmethod
+    def normalize_units(values, unit_scales):
+        """
+        Converts Athena succinct values (e.g. `98.01ms`, `433.29kB`, `17038 rows`) according to their unit scale.
+        Values that can't be parsed or have unknown units are set to NaN.
+
+        >>> AthenaParser.normalize_units(pd.Series(['98.01ms', '2s', '1.5h', '7', None]), AthenaParser.cpu_time_scales)
+        0       0.09801
+        1       2.00000
+        2    5400.00000
+        3           NaN
+        4           NaN
+        dtype: float64
+        """
+        parts = values.astype(str).str.extract(r'^\s*(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>[a-zA-Z]*)\s*$')
+        return pd.to_numeric(parts['number']) * parts['unit'].map(unit_scales)
 
-        for i, row in df.iterrows():
-            relevant_ops = df.query(f"target=={row['source']} & query_hash=='{row['query_hash']}'")
-            if row.operation_type in self.redundent_operation_names:
-                df.loc[i, 'redundent_operation'] = sum(relevant_ops.actual_rows) == row.actual_rows
+    def enrich_stats(self, df):
+        df['nodeOutputRows'] = AthenaParser.normalize_units(df['nodeOutputRows'], self.rows_scales)
+        df['nodeOutputDataSize'] = AthenaParser.normalize_units(df['nodeOutputDataSize'], self.data_size_scales)
+        df['nodeCpuTime'] = AthenaParser.normalize_units(df['nodeCpuTime'], self.cpu_time_scales)
 
-            if any(op in row.label.split(' ') for op in self.label_replacement.keys()):
-                df.loc[i, 'label'] = self.label_replacement[row.label].join(relevant_ops.label)
+        # A filter is redundant when it outputs every row it gets from its sub-operations
+        sub_operations_stats = DBParser.aggregate_sub_operations(df, sum_output_rows=('nodeOutputRows', 'sum'))
+        df['redundent_operation'] = df['operation_type'].isin(self.redundent_operation_names) & (
+            sub_operations_stats['sum_output_rows'].fillna(0) == df['nodeOutputRows']
+        )
 
-        return df
+        return self.merge_operation_labels(df)
 
 
 if __name__ == '__main__':
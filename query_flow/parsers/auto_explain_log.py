@@ -0,0 +1,134 @@
+import collections
+import gzip
+import json
+import logging
+import mmap
+import os
+import re
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from .postgres_parser import PostgresParser
+except ImportError:
+    # Support running doctests not as a module
+    from postgres_parser import PostgresParser  # type: ignore
+
+__all__ = ['AutoExplainLog', 'ingest_auto_explain_log', 'LogIngestionStats']
+
+logger = logging.getLogger(__name__)
+
+LogIngestionStats = collections.namedtuple(
+    'LogIngestionStats', ['plans', 'skipped_plans', 'megabytes', 'seconds', 'megabytes_per_second']
+)
+
+# auto_explain (log_format=json) logs `duration: 1.234 ms  plan:` followed by the plan, every continuation line of the
+# stderr log is prefixed by a tab. The JSON is indented, so the only line closing a brace at the start is its end.
+PLAN_PATTERN = re.compile(rb'plan:[ \t]*\r?\n(\t?\{.*?\n\t?\})', re.DOTALL)
+PLAN_START_PATTERN = re.compile(rb'plan:[ \t]*\r?\n$')
+PLAN_END_PATTERN = re.compile(rb'\t?\}\s*$')
+
+
+class AutoExplainLog:
+    """
+    Iterates over the JSON payloads (as bytes) of the plans logged by auto_explain in a Postgres log file.
+    Plain log files are memory-mapped and scanned without being loaded, gzip compressed ones (`.gz`) are streamed.
+    `scanned_bytes` tracks the (uncompressed) position of the scan.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile(suffix='.log') as log_file:
+    ...     _ = log_file.write(b'LOG:  duration: 0.1 ms  plan:\\n\\t{\\n\\t  "Plan": {"Node Type": "Result"}\\n\\t}\\n')
+    ...     log_file.flush()
+    ...     log = AutoExplainLog(log_file.name)
+    ...     list(log), log.scanned_bytes
+    ([b'\\t{\\n\\t  "Plan": {"Node Type": "Result"}\\n\\t}'], 71)
+    """
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.scanned_bytes = 0
+
+    def __iter__(self):
+        self.scanned_bytes = 0
+        if str(self.log_path).endswith('.gz'):
+            yield from self._iter_gzip_plans()
+        else:
+            yield from self._iter_mapped_plans()
+
+    def _iter_mapped_plans(self):
+        with open(self.log_path, 'rb') as log_file:
+            log_size = os.fstat(log_file.fileno()).st_size
+            if not log_size:
+                return  # Empty files can't be memory-mapped
+
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                for match in PLAN_PATTERN.finditer(log_map):
+                    self.scanned_bytes = match.end()
+                    yield match.group(1)
+            self.scanned_bytes = log_size
+
+    def _iter_gzip_plans(self):
+        plan_lines = None
+        with gzip.open(self.log_path, 'rb') as log_file:
+            for line in log_file:
+                if plan_lines is None:
+                    if PLAN_START_PATTERN.search(line):
+                        plan_lines = []
+                    continue
+
+                plan_lines.append(line)
+                if PLAN_END_PATTERN.match(line):
+                    self.scanned_bytes = log_file.tell()
+                    yield b''.join(plan_lines).rstrip()
+                    plan_lines = None
+            self.scanned_bytes = log_file.tell()
+
+
+def ingest_auto_explain_log(log_path, parser=None, batch_size=1000):
+    """
+    Streams the plans of an auto_explain log into the parser in batches (see `DBParser.add_plans`).
+    Returns the combined flow and the ingestion stats, payloads that aren't valid JSON plans are skipped.
+    The throughput is measured on the scanned (uncompressed) size of the log.
+    """
+    parser = parser or PostgresParser()
+    loads = orjson.loads if orjson is not None else json.loads
+    start = time.perf_counter()
+
+    log = AutoExplainLog(log_path)
+    batch, plans, skipped_plans = [], 0, 0
+    for payload in log:
+        try:
+            batch.append(parser.execution_plan_extractor(loads(payload)))
+        except (ValueError, KeyError, TypeError):
+            skipped_plans += 1
+            continue
+
+        if len(batch) == batch_size:
+            parser.add_plans(batch)
+            plans, batch = plans + len(batch), []
+    if batch:
+        parser.add_plans(batch)
+        plans += len(batch)
+
+    seconds = time.perf_counter() - start
+    megabytes = log.scanned_bytes / 2 ** 20
+    stats = LogIngestionStats(plans, skipped_plans, megabytes, seconds, megabytes / seconds if seconds else 0.0)
+    logger.info(
+        'Ingested %d plans (%d skipped) from %.1f MB in %.2fs (%.1f MB/s)',
+        plans,
+        skipped_plans,
+        megabytes,
+        seconds,
+        stats.megabytes_per_second,
+    )
+    return parser.live_flow_df, stats
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -1,26 +1,118 @@
 import hashlib
+import itertools
 import json
+import logging
+import math
+import os
+import pickle
+import threading
 import typing
 from abc import ABC, abstractmethod
-from dataclasses import asdict, field, make_dataclass
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import field, fields, make_dataclass
 from functools import wraps
+from operator import attrgetter
 
 import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+
+from query_flow.utils.instrumentation import measure_stage
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 __all__ = ['DBParser']
 
+logger = logging.getLogger(__name__)
+
+
+def _fast_digest(data):
+    """A 64 bit non-cryptographic digest, xxh3 when xxhash is installed and blake2b otherwise."""
+    if xxhash is not None:
+        return xxhash.xxh3_64_digest(data)
+    return hashlib.blake2b(data, digest_size=8).digest()
+
 
 class DBParser(ABC):
     label_replacement = {'UNION': ' U ', 'JOIN': ' ⋈ ', 'UNION ALL': ' U '}
     required_parsed_attr = frozenset(['label', 'label_metadata'])
-    max_supported_nodes = 10000
-
-    def __init__(self, is_compact=False):
-        assert set(self.strategy_dict.keys()).issubset(set(self.description_dict.keys()))
+    hash_modes = frozenset(['sha224', 'fast'])
+    # String columns repeated across the rows, stored as categoricals by `compact_flow_df`
+    categorical_columns = frozenset(
+        ['operation_type', 'label', 'label_metadata', 'node_hash', 'subtree_hash', 'query_hash', 'fragment_id']
+    )
+    # Shards per parse worker, smaller shards balance plans of different sizes across the workers
+    shards_per_worker = 4
+    # State that can't be pickled (or isn't needed) when the parser is sent to the parse workers
+    transient_attrs = frozenset(
+        [
+            'dispatch_table',
+            'default_strategy',
+            'plan_cache',
+            'parse_memo',
+            'engines',
+            '_engines_lock',
+            'parsed_node_class',
+            '_parsed_node_values',
+            '_parsed_node_metrics',
+            'label_to_id_dict',
+            'parsed_rows',
+            'source_ids',
+            'target_ids',
+            'flow_df',
+            'live_flow_dfs',
+            'live_id_space',
+            '_live_flow_df',
+            'instrumentation',
+        ]
+    )
+
+    def __init__(
+        self,
+        is_compact=False,
+        pool_size=None,
+        plan_cache=None,
+        memoize=False,
+        memo_dir=None,
+        hash_mode='sha224',
+        parse_workers=1,
+        instrumentation=None,
+        compact_dtypes=False,
+    ):
+        assert hash_mode in self.hash_modes, f'hash_mode should be one of {sorted(self.hash_modes)}'
         self.is_compact = is_compact
+        self.hash_mode = hash_mode
+        self.pool_size = pool_size
+        self.plan_cache = plan_cache
+        self.memoize = memoize or memo_dir is not None
+        self.memo_dir = memo_dir
+        self.parse_workers = parse_workers
+        self.compact_dtypes = compact_dtypes
+        self._init_transient_state()
+        self.instrumentation = instrumentation
+        assert set(self.dispatch_table.keys()).issubset(set(self.description_dict.keys()))
+
+    def _init_transient_state(self):
+        # The strategies are bound once per parser, instead of rebuilding the dict for every parsed node
+        self.dispatch_table = self.strategy_dict
+        self.default_strategy = self.parse_base
+        self.parse_memo = {}
+        # Stage timings aren't reported back from the parse workers, only the whole parse is
+        self.instrumentation = None
+        self.engines = {}
+        self._engines_lock = threading.Lock()
+        self.clear_live_flow()
         self.parsed_node_class = self._make_parsed_node()
+        self.flow_columns = [parsed_field.name for parsed_field in fields(self.parsed_node_class)]
+        # Ids are buffered in their own integer arrays, the rest of the parsed node as a single tuple
+        self.id_columns = ['source', 'target']
+        self.value_columns = [column for column in self.flow_columns if column not in self.id_columns]
+        self._parsed_node_values = attrgetter(*self.value_columns)
+        self.metric_columns = sorted(self.normalize_metric(metric) for metric in self.supported_metrics)
+        self._parsed_node_metrics = attrgetter(*self.metric_columns)
         self._cleanup_state()
 
     @property
@@ -37,6 +129,35 @@ class DBParser(ABC):
     def execution_plan_extractor(self):
         pass
 
+    def load_execution_plan(self, plan_text):
+        """Loads a plan saved to a file (the JSON output of the engine's EXPLAIN), ready to be parsed."""
+        return self.execution_plan_extractor(json.loads(plan_text))
+
+    def check_execution_plan(self, execution_plan):
+        """
+        Raises a ValueError unless every operation of the plan has a type, e.g. for JSON files that aren't plans.
+
+        >>> from query_flow.parsers.postgres_parser import PostgresParser
+        >>> PostgresParser().check_execution_plan({'Node Type': 'Limit', 'Plans': [{'Node Type': 'Result'}]})
+        >>> PostgresParser().check_execution_plan({'Node Type': 'Limit', 'Plans': [{'a': 1}]})
+        Traceback (most recent call last):
+        ...
+        ValueError: Not a PostgresParser execution plan, an operation has no type: {'a': 1}
+        """
+        try:
+            pending_nodes = list(self._iter_plan_roots(execution_plan))
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError(f'Not a {type(self).__name__} execution plan: {e!r}') from e
+        while pending_nodes:
+            execution_node = pending_nodes.pop()
+            try:
+                self.node_type_extractor(execution_node)
+                sub_nodes = list(execution_node.get(self.next_operator_indicator, []))
+            except (KeyError, TypeError, AttributeError) as e:
+                error = f'Not a {type(self).__name__} execution plan, an operation has no type: {execution_node!r:.80}'
+                raise ValueError(error) from e
+            pending_nodes.extend(sub_nodes)
+
     @abstractmethod
     def normalize_metric(self):
         pass
@@ -70,70 +191,370 @@ class DBParser(ABC):
     def enrich_stats(self):
         pass
 
+    def get_engine(self, con_str):
+        """Engines (and their connection pools) are created once per connection string and reused across queries."""
+        from sqlalchemy import create_engine  # Only querying needs sqlalchemy (and the dialects), keep imports fast
+
+        with self._engines_lock:
+            if con_str not in self.engines:
+                engine_kwargs = {'pool_size': self.pool_size} if self.pool_size else {}
+                self.engines[con_str] = create_engine(con_str, **engine_kwargs)
+            return self.engines[con_str]
+
+    def close(self):
+        with self._engines_lock:
+            for engine in self.engines.values():
+                engine.dispose()
+            self.engines.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        return {name: value for name, value in self.__dict__.items() if name not in self.transient_attrs}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.plan_cache = None
+        self._init_transient_state()
+
     def from_query(self, query, con_str):
-        with create_engine(con_str).connect() as con:
+        with measure_stage(self.instrumentation, 'from_query'):
+            if self.plan_cache is None:
+                return self._explain_query(query, con_str)
+
+            cache_key = self.plan_cache.make_key(query, con_str, self.query_prefix)
+            execution_plan = self.plan_cache.get(cache_key)
+            if execution_plan is None:
+                execution_plan = self._explain_query(query, con_str)
+                self.plan_cache.put(cache_key, execution_plan)
+            return execution_plan
+
+    def _explain_query(self, query, con_str):
+        with self.get_engine(con_str).connect() as con:
             # SQLALCHEMY doesn't handle % as a regular SQL client so one need to add additional %
             explain_analyze_query = f"{self.query_prefix} {query.replace('%', '%%')}"
 
             # Grab the execution plan string in case its returned as a single row
-            execution_plan = con.execute(explain_analyze_query).fetchone().values()[0][0]
+            with measure_stage(self.instrumentation, 'database'):
+                execution_plan = con.execute(explain_analyze_query).fetchone().values()[0][0]
 
             return self.execution_plan_extractor(execution_plan)
 
     def parse(self, execution_plans):
+        workers = self.parse_workers or os.cpu_count()
+        if workers > 1 and not self.memoize:
+            # The plans are sharded by position, serial and memoized parses take any iterable as is
+            execution_plans = list(execution_plans)
+        with measure_stage(self.instrumentation, 'parse') as stats:
+            if self.memoize:
+                flow_df = self._parse_memoized(execution_plans)
+            elif workers > 1 and len(execution_plans) > 1:
+                flow_df = self._parse_parallel(execution_plans, workers)
+            else:
+                flow_df = self._parse(execution_plans)
+            stats['frame'] = flow_df
+        return flow_df
 
+    def _parse_parallel(self, execution_plans, workers):
+        """
+        Shards the plans across a process pool (`parse_workers=None` uses every core), every shard is parsed and
+        enriched on its own and the shards are merged by `concat_flow_dfs`.
+        """
+        shard_size = -(-len(execution_plans) // (workers * self.shards_per_worker))
+        shard_bounds = [*range(0, len(execution_plans), shard_size), len(execution_plans)]
+        shards = [execution_plans[start:end] for start, end in zip(shard_bounds, shard_bounds[1:])]
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+            return self.concat_flow_dfs(list(executor.map(self._parse, shards)))
+
+    def _parse(self, execution_plans, query_hashes=None):
         self._cleanup_state()
+        with measure_stage(self.instrumentation, 'parse_nodes') as stats:
+            for execution_plan, query_hash in zip(execution_plans, query_hashes or itertools.repeat(None)):
+                for parsed_node in self.iter_nodes(execution_plan, query_hash):
+                    self._append_parsed_node(parsed_node)
+
+            # Building the frame once from the accumulated columns keeps parsing linear in the number of nodes
+            self.flow_df = self._make_flow_df()
+            stats.update(nodes=len(self.parsed_rows), frame=self.flow_df)
+
+        # Compact ids depend on the plans parsed before, the rows (in plan order) are positioned for the merge labels
+        with measure_stage(self.instrumentation, 'align_source_target_ids') as stats:
+            flow_df = self.flow_df.assign(plan_position=np.arange(len(self.flow_df)))
+            stats['frame'] = flow_df = DBParser.align_source_target_ids(flow_df)
+        with measure_stage(self.instrumentation, 'enrich_stats') as stats:
+            stats['frame'] = flow_df = self.enrich_stats(flow_df).drop(columns='plan_position')
+        return self._compact_dtypes(flow_df) if self.compact_dtypes else flow_df
+
+    def _parse_memoized(self, execution_plans):
+        """Every plan is parsed and enriched on its own, so plans seen before are served from the memo."""
+        flow_dfs = []
         for execution_plan in execution_plans:
+            query_hash = DBParser._hash_execution_plan(execution_plan)
+            flow_df = self._load_memo(query_hash)
+            if flow_df is None:
+                flow_df = self._parse([execution_plan], [query_hash])
+                self._store_memo(query_hash, flow_df)
+            flow_dfs.append(flow_df)
+        return self.concat_flow_dfs(flow_dfs)
+
+    def _memo_path(self, query_hash):
+        # Memo directories can be shared by parsers configured differently, every configuration has its own flows
+        mode = 'compact' if self.is_compact else 'full'
+        dtypes = 'compact_dtypes' if self.compact_dtypes else 'dtypes'
+        return os.path.join(self.memo_dir, f'{type(self).__name__}-{mode}-{self.hash_mode}-{dtypes}-{query_hash}.pkl')
+
+    def _load_memo(self, query_hash):
+        if query_hash not in self.parse_memo and self.memo_dir is not None:
+            if os.path.exists(self._memo_path(query_hash)):
+                self.parse_memo[query_hash] = pd.read_pickle(self._memo_path(query_hash))
+        return self.parse_memo.get(query_hash)
+
+    def _store_memo(self, query_hash, flow_df):
+        self.parse_memo[query_hash] = flow_df
+        if self.memo_dir is not None:
+            os.makedirs(self.memo_dir, exist_ok=True)
+            flow_df.to_pickle(self._memo_path(query_hash))
+
+    def add_plans(self, execution_plans):
+        """
+        Adds plans to the live flow without reparsing the plans added before, e.g. to keep a notebook or a service
+        updated. Returns only the rows of the new plans, their ids are stable and shared with `live_flow_df`.
+        """
+        flow_df = self._remap_flow_ids(self.parse(execution_plans), self.live_id_space)
+        self.live_flow_dfs.append(flow_df)
+        self._live_flow_df = None
+        return flow_df
 
-            # todo refactor
-            if 'fragments' in execution_plan:
-                for fragment in reversed(execution_plan['fragments']):
-                    self.parse_node(
-                        ({'fragment_id': fragment['id'], **fragment['logicalPlan']['1'][0]}),
-                        target_id=np.nan,
-                        query_hash=DBParser._hash_execution_plan(execution_plan),
-                    )
-            else:
-                self.parse_node(
-                    execution_plan, target_id=np.nan, query_hash=DBParser._hash_execution_plan(execution_plan)
-                )
+    @property
+    def live_flow_df(self):
+        """All the rows added by `add_plans`, combined as a single flow."""
+        if self._live_flow_df is None:
+            self._live_flow_df = self._concat_remapped_flow_dfs(self.live_flow_dfs)
+        return self._live_flow_df
+
+    def clear_live_flow(self):
+        self.live_flow_dfs = []
+        self.live_id_space = {'hash_to_id': {}, 'next_id': 0}
+        self._live_flow_df = None
+
+    def concat_flow_dfs(self, flow_dfs):
+        """
+        Concatenates separately parsed flows, remapping their ids into a single id space.
+        In compact mode operations sharing a node_hash share their id across the flows, as in a single parse.
+        """
+        id_space = {'hash_to_id': {}, 'next_id': 0}
+        return self._concat_remapped_flow_dfs([self._remap_flow_ids(flow_df, id_space) for flow_df in flow_dfs])
+
+    def _remap_flow_ids(self, flow_df, id_space):
+        """Remaps the ids of a separately parsed flow into `id_space`, which is updated with the new ids."""
+        id_map, hash_to_id = {}, id_space['hash_to_id']
+        if self.is_compact:
+            operations = flow_df.drop_duplicates('source')
+            for local_id, node_hash in zip(operations['source'], operations['node_hash']):
+                if node_hash not in hash_to_id:
+                    hash_to_id[node_hash] = id_space['next_id']
+                    id_space['next_id'] += 1
+                id_map[local_id] = hash_to_id[node_hash]
+
+        # Every other id (all of them when not compact) is unique to its flow
+        for local_id in pd.unique(np.concatenate([flow_df['source'], flow_df['target']])):
+            if local_id not in id_map:
+                id_map[local_id] = id_space['next_id']
+                id_space['next_id'] += 1
+
+        remapped_flow_df = flow_df.assign(source=flow_df['source'].map(id_map), target=flow_df['target'].map(id_map))
+        return remapped_flow_df.sort_values(by='source', kind='stable', ignore_index=True)
+
+    def _concat_remapped_flow_dfs(self, flow_dfs):
+        if not flow_dfs:
+            return pd.DataFrame(columns=self.flow_columns)
+        flow_df = pd.concat(flow_dfs, ignore_index=True)
+        flow_df = flow_df.sort_values(by='source', kind='stable', ignore_index=True)
+        # Categoricals of different flows don't share their categories, so they are concatenated as strings
+        return self._compact_dtypes(flow_df) if self.compact_dtypes else flow_df
+
+    def _compact_dtypes(self, flow_df):
+        with measure_stage(self.instrumentation, 'compact_dtypes') as stats:
+            stats['frame'] = compact_flow_df = DBParser.compact_flow_df(flow_df, self.categorical_columns)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                'Compacted %d flow rows from %.1fMB to %.1fMB',
+                len(flow_df),
+                flow_df.memory_usage(deep=True).sum() / 2 ** 20,
+                compact_flow_df.memory_usage(deep=True).sum() / 2 ** 20,
+            )
+        return compact_flow_df
 
-        flow_df = DBParser.align_source_target_ids(self.flow_df)
-        flow_df = self.enrich_stats(flow_df)
-        return flow_df
+    @staticmethod
+    def compact_flow_df(flow_df, categorical_columns=categorical_columns):
+        """
+        Stores the repeated strings as categoricals, the ids (and integer metrics) as int32 and the float metrics as
+        float32, as long as every value fits. Integral floats (e.g. row counts) stay float64 beyond 2 ** 24, where
+        float32 can't hold them exactly.
+
+        >>> flow_df = pd.DataFrame(
+        ...     {'source': [0, 1], 'label': ['Scan', 'Scan'], 'cost': [0.5, np.nan], 'rows': [1.0, 2.0 ** 25]}
+        ... )
+        >>> DBParser.compact_flow_df(flow_df, ['label']).dtypes.astype(str).to_dict()
+        {'source': 'int32', 'label': 'category', 'cost': 'float32', 'rows': 'float64'}
+        """
+        dtypes = {}
+        for column, dtype in flow_df.dtypes.items():
+            values = flow_df[column].to_numpy()
+            if column in categorical_columns and dtype == object:
+                dtypes[column] = 'category'
+            elif dtype == np.int64 and DBParser._fits_int32(values):
+                dtypes[column] = np.int32
+            elif dtype == np.float64 and DBParser._fits_float32(values):
+                dtypes[column] = np.float32
+        return flow_df.astype(dtypes)
+
+    @staticmethod
+    def _fits_int32(values):
+        int32_info = np.iinfo(np.int32)
+        return not len(values) or int32_info.min <= values.min() and values.max() <= int32_info.max
+
+    @staticmethod
+    def _fits_float32(values):
+        finite_values = np.abs(values[np.isfinite(values)])
+        if not len(finite_values):
+            return True
+        max_value = finite_values.max()
+        is_integral = np.array_equal(finite_values, np.floor(finite_values))
+        return max_value <= np.finfo(np.float32).max and (not is_integral or max_value <= 2 ** 24)
 
     def _cleanup_state(self):
         self.label_to_id_dict = {}
+        self.parsed_rows = []
+        self.source_ids, self.target_ids = array('q'), array('q')
         self.flow_df = pd.DataFrame({})
-        self.max_id = np.int64(self.max_supported_nodes)
+        self.next_id = 0
+
+    def iter_nodes(self, execution_plan, query_hash=None):
+        """
+        Lazily yields the parsed nodes of a single execution plan, each tagged with the plan query_hash.
+        Ids are shared with the parser state, so nodes of consecutive plans can be streamed into the same sink.
+
+        With hash_mode='fast' every node also gets a subtree_hash, a digest of its node_hash and the subtree_hash of
+        its sub-operations, so identical subtrees share it across plans. The query_hash is then derived from the
+        subtree_hash of the plan roots and the metrics of every node instead of serializing the whole plan, which
+        means the nodes of a plan are only yielded once it is fully traversed.
+        """
+        if self.hash_mode != 'fast':
+            query_hash = query_hash or DBParser._hash_execution_plan(execution_plan)
+            for plan_root in self._iter_plan_roots(execution_plan):
+                yield from self._iter_sub_nodes(plan_root, target_id=np.nan, query_hash=query_hash)
+            return
+
+        parsed_nodes, subtree_digests = [], []
+        for plan_root in self._iter_plan_roots(execution_plan):
+            parsed_nodes.extend(self._iter_sub_nodes(plan_root, np.nan, query_hash, subtree_digests))
+
+        # Plans sharing a structure usually differ in their metrics (e.g. re-runs), anywhere below their roots too
+        if not query_hash:
+            nodes_metrics = pickle.dumps(list(map(self._parsed_node_metrics, parsed_nodes)), protocol=4)
+            query_hash = _fast_digest(b''.join(subtree_digests) + nodes_metrics).hex()
+        for parsed_node in parsed_nodes:
+            parsed_node.query_hash = query_hash
+        yield from parsed_nodes
 
-    def parse_node(self, execution_node, target_id, query_hash):
-        # Parsing current-expression
-        node_type = self.node_type_extractor(execution_node)
-        parsed_nodes, source_id = self.strategy_dict.get(node_type, self.parse_base)(target_id, execution_node)
-        parsed_nodes = [dict(asdict(parsed_node), **{'query_hash': query_hash}) for parsed_node in parsed_nodes]
-        # Currently we use state to save already parsed records, a cleaner version will is
-        # provide calculated result as parameter and add return to the  function
-        self.flow_df = self.flow_df.append(parsed_nodes, ignore_index=True)
+    @staticmethod
+    def _iter_plan_roots(execution_plan):
+        # todo refactor
+        if 'fragments' in execution_plan:
+            for fragment in reversed(execution_plan['fragments']):
+                yield {'fragment_id': fragment['id'], **fragment['logicalPlan']['1'][0]}
+        else:
+            yield execution_plan
 
-        # Recursively parsing sub-expressions
-        if self.next_operator_indicator in execution_node:
-            target_id = source_id or target_id
+    def parse_node(self, execution_node, target_id, query_hash):
+        for parsed_node in self._iter_sub_nodes(execution_node, target_id, query_hash):
+            self._append_parsed_node(parsed_node)
+
+    def _iter_sub_nodes(self, execution_node, target_id, query_hash, subtree_digests=None):
+        # An explicit stack instead of recursion, so the plan depth is bounded by memory and not by the recursion limit
+        pending_nodes = [(execution_node, target_id)]
+        while pending_nodes:
+            execution_node, target_id = pending_nodes.pop()
+            if execution_node is None:
+                # A post-visit marker, the sub-expressions of its parsed nodes are already hashed
+                DBParser._hash_subtree(*target_id, subtree_digests)
+                continue
+
+            # Parsing current-expression
+            node_type = self.node_type_extractor(execution_node)
+            parsed_nodes, source_id = self.dispatch_table.get(node_type, self.default_strategy)(
+                target_id, execution_node
+            )
+            for parsed_node in parsed_nodes:
+                parsed_node.query_hash = query_hash
+                yield parsed_node
+
+            next_execution_nodes = execution_node.get(self.next_operator_indicator, [])
+            if subtree_digests is not None:
+                pending_nodes.append((None, (parsed_nodes, len(next_execution_nodes))))
+
+            # Sub-expressions are pushed in reverse so they are visited (and get their ids) in the plan order
+            if next_execution_nodes:
+                target_id = source_id if source_id is not None else target_id
+                pending_nodes.extend(
+                    (next_execution_node, target_id) for next_execution_node in reversed(next_execution_nodes)
+                )
 
-            for next_execution_node in execution_node[self.next_operator_indicator]:
-                self.parse_node(next_execution_node, target_id, query_hash)
+    @staticmethod
+    def _hash_subtree(parsed_nodes, sub_nodes_count, subtree_digests):
+        """
+        Pops the digests of the sub-expressions, chains them through the parsed nodes of the expression (e.g. a
+        filter and the scan below it) and pushes the digest of the expression in their place.
+        """
+        sub_digests_start = len(subtree_digests) - sub_nodes_count
+        digest = b''.join(subtree_digests[sub_digests_start:])
+        del subtree_digests[sub_digests_start:]
+        for parsed_node in reversed(parsed_nodes):
+            digest = _fast_digest(parsed_node.node_hash.encode() + digest)
+            parsed_node.subtree_hash = digest.hex()
+        subtree_digests.append(digest)
+
+    def _append_parsed_node(self, parsed_node):
+        self.source_ids.append(parsed_node.source)
+        # Operations without a target (the plan roots) are marked by a negative id
+        self.target_ids.append(-1 if math.isnan(parsed_node.target) else parsed_node.target)
+        self.parsed_rows.append(self._parsed_node_values(parsed_node))
+
+    def _make_flow_df(self):
+        # The rows are transposed once into columns, building the frame from the rows would convert every value
+        columns = zip(*self.parsed_rows) if self.parsed_rows else [[] for _ in self.value_columns]
+        flow_columns = dict(zip(self.value_columns, columns))
+
+        # Ids are allocated in ascending order and mirrored here, so (as the flows are ordered by their source) the
+        # operations reading the tables come first and the plan roots last
+        source_ids = np.frombuffer(self.source_ids, dtype=np.int64)
+        target_ids = np.frombuffer(self.target_ids, dtype=np.int64)
+        flow_columns['source'] = self.next_id - 1 - source_ids
+        flow_columns['target'] = np.where(target_ids < 0, np.nan, self.next_id - 1 - target_ids)
+        return pd.DataFrame(flow_columns, columns=self.flow_columns)
 
     def _get_hash(self, execution_node, specific_attrs):
         representation = self.node_type_extractor(execution_node)
         if specific_attrs:
             representation += f"{specific_attrs['label']} {specific_attrs['label_metadata']}"
+        if self.hash_mode == 'fast':
+            return _fast_digest(representation.encode()).hex()
         return hashlib.sha224(representation.encode()).hexdigest()
 
     def _get_next_id(self, hash_node):
-        if hash_node not in self.label_to_id_dict or not self.is_compact:
-            self.max_id -= 1
-            self.label_to_id_dict[hash_node] = self.max_id
-
+        """Ids are dense and zero based, in compact mode operations sharing a hash share their id."""
+        if not self.is_compact:
+            self.next_id += 1
+            return self.next_id - 1
+
+        if hash_node not in self.label_to_id_dict:
+            self.label_to_id_dict[hash_node] = self.next_id
+            self.next_id += 1
         return self.label_to_id_dict[hash_node]
 
     def _make_parsed_node(self):
@@ -141,7 +562,7 @@ class DBParser(ABC):
             (self.normalize_metric(metric), typing.Any, field(default=np.nan, repr=False))
             for metric in self.supported_metrics
         ]
-        return make_dataclass(
+        parsed_node_class = make_dataclass(
             'ParsedNode',
             [
                 ('source', np.int64),
@@ -152,25 +573,76 @@ class DBParser(ABC):
                 ('node_hash', str, field(repr=False)),
                 ('fragment_id', str, field(default='', repr=False)),
                 *supported_metrics_fields,
+                ('query_hash', str, field(default='', repr=False)),
+                *([('subtree_hash', str, field(default='', repr=False))] if self.hash_mode == 'fast' else []),
             ],
         )
+        return DBParser._add_slots(parsed_node_class)
+
+    @staticmethod
+    def _add_slots(dataclass_type):
+        """
+        Recreates a dataclass with `__slots__`, as `dataclass(slots=True)` does since python 3.10, so every parsed
+        node is a compact record without a `__dict__`.
+        The defaults are kept by the generated `__init__`, so their class attributes (which conflict with the slots)
+        are dropped.
+
+        >>> Point = DBParser._add_slots(make_dataclass('Point', [('x', int), ('y', int, field(default=0))]))
+        >>> Point(1), hasattr(Point(1), '__dict__')
+        (Point(x=1, y=0), False)
+        """
+        field_names = tuple(dataclass_field.name for dataclass_field in fields(dataclass_type))
+        namespace = {
+            name: value
+            for name, value in dataclass_type.__dict__.items()
+            if name not in field_names and name not in ('__dict__', '__weakref__')
+        }
+        namespace['__slots__'] = field_names
+        return type(dataclass_type)(dataclass_type.__name__, dataclass_type.__bases__, namespace)
 
     @staticmethod
     def _hash_execution_plan(execution_plan):
-        representation = json.dumps(execution_plan)
+        try:
+            representation = json.dumps(execution_plan)
+        except RecursionError:
+            representation = ''.join(DBParser._iter_json_chunks(execution_plan))
         return hashlib.sha224(representation.encode()).hexdigest()
 
+    @staticmethod
+    def _iter_json_chunks(value):
+        """
+        Yields the same text as `json.dumps`, walking the value with an explicit stack so plans deeper than the
+        recursion limit can still be hashed.
+
+        >>> ''.join(DBParser._iter_json_chunks({'a': [1, {'b': None}], 2: 'c', 'd': {}}))
+        '{"a": [1, {"b": null}], "2": "c", "d": {}}'
+        """
+        pending_values = [(True, value)]
+        while pending_values:
+            is_value, value = pending_values.pop()
+            if not is_value:
+                yield value
+            elif isinstance(value, dict) and value:
+                chunks = []
+                for key, sub_value in value.items():
+                    key = key if isinstance(key, str) else json.dumps(key)
+                    chunks += [(False, f'{", " if chunks else "{"}{json.dumps(key)}: '), (True, sub_value)]
+                pending_values += reversed(chunks + [(False, '}')])
+            elif isinstance(value, (list, tuple)) and value:
+                chunks = []
+                for sub_value in value:
+                    chunks += [(False, ', ' if chunks else '['), (True, sub_value)]
+                pending_values += reversed(chunks + [(False, ']')])
+            else:
+                yield json.dumps(value)
+
     @staticmethod
     def parse_default_decor(func):
         @wraps(func)
         def parse(self, target_id, execution_node):
             specific_attrs = func(self, execution_node)
-            defaults_attrs, source_id = self._parse_default(
-                target_id,
-                execution_node,
-                specific_attrs,
-            )
-            return [self.parsed_node_class(**{**defaults_attrs, **specific_attrs})], source_id
+            parsed_node, source_id = self._parse_default(target_id, execution_node, specific_attrs)
+            return [parsed_node], source_id
 
         return parse
 
@@ -180,41 +652,19 @@ class DBParser(ABC):
         def parse(self, target_id, execution_node):
             filter_func, clause_func = func(self)
 
+            parsed_nodes = []
             if self.filter_indicator(execution_node):
-                filter_attrs = filter_func(execution_node)
-                defaults_attrs, source_id = self._parse_default(
-                    target_id,
-                    execution_node,
-                    filter_attrs,
-                )
-                filter_node = self.parsed_node_class(
-                    **{
-                        **defaults_attrs,
-                        **filter_attrs,
-                    }
-                )
-                target_id = source_id
+                filter_node, target_id = self._parse_default(target_id, execution_node, filter_func(execution_node))
+                parsed_nodes.append(filter_node)
 
-            clause_attrs = clause_func(execution_node)
-            defaults_attrs, source_id = self._parse_default(
-                target_id,
-                execution_node,
-                clause_attrs,
-            )
-
-            non_filter_node = self.parsed_node_class(
-                **{
-                    **defaults_attrs,
-                    **clause_attrs,
-                }
-            )
-            parsed_node = [filter_node, non_filter_node] if self.filter_indicator(execution_node) else [non_filter_node]
-
-            return parsed_node, source_id
+            non_filter_node, source_id = self._parse_default(target_id, execution_node, clause_func(execution_node))
+            parsed_nodes.append(non_filter_node)
+            return parsed_nodes, source_id
 
         return parse
 
     def _parse_default(self, target_id, execution_node, specific_attrs):
+        """Builds the parsed node, the specific attributes take precedence over the default ones and the metrics."""
         assert all(attr in specific_attrs for attr in self.required_parsed_attr)
 
         current_hash = self._get_hash(execution_node, specific_attrs)
@@ -232,32 +682,81 @@ class DBParser(ABC):
             parsed_node['fragment_id'] = self.last_fragment_id
 
         parsed_node = self.add_supported_metrics(parsed_node, execution_node)
-        return parsed_node, source_id
+        parsed_node.update(specific_attrs)
+        return self.parsed_node_class(**parsed_node), source_id
+
+    @staticmethod
+    def aggregate_sub_operations(flow_df, **aggregations):
+        """
+        Aggregates the direct sub-operations of every operation (the rows targeting it within the same query),
+        aligned to the rows of `flow_df`. Operations without sub-operations get NaN.
+
+        >>> flow_df = pd.DataFrame({'source': [0, 1, 2], 'target': [2, 2, 3], 'query_hash': 'q', 'rows': [1, 4, 5]})
+        >>> DBParser.aggregate_sub_operations(flow_df, max_rows=('rows', 'max'))
+           max_rows
+        0       NaN
+        1       NaN
+        2       4.0
+        """
+        sub_operations = flow_df.groupby(['query_hash', 'target']).agg(**aggregations)
+        sub_operations.index.names = ['query_hash', 'source']
+        return flow_df[['query_hash', 'source']].join(sub_operations, on=['query_hash', 'source'])[list(aggregations)]
+
+    def merge_operation_labels(self, flow_df):
+        """
+        Labels UNION/JOIN operations by the labels of the operations they merge, e.g. `People ⋈ Titles`.
+        Operations are labeled from the last in the plan (a `plan_position` column, by default their descending
+        source), so merges are labeled before the merges consuming them and list their sub-operations in that order.
+        """
+        is_merge = flow_df['label'].isin(self.label_replacement.keys()).to_numpy()
+        if not is_merge.any():
+            return flow_df
+
+        sub_operations_positions = flow_df.groupby(['query_hash', 'target']).indices
+        labels = flow_df['label'].to_numpy(dtype=object, copy=True)
+        query_hashes, sources = flow_df['query_hash'].to_numpy(), flow_df['source'].to_numpy()
+        label_order = -flow_df['plan_position'].to_numpy() if 'plan_position' in flow_df else sources
+        for position in sorted(np.flatnonzero(is_merge), key=label_order.__getitem__):
+            sub_positions = sub_operations_positions.get((query_hashes[position], sources[position]), [])
+            sub_positions = sorted(sub_positions, key=label_order.__getitem__)
+            labels[position] = self.label_replacement[labels[position]].join(labels[sub_positions])
+
+        flow_df['label'] = labels
+        return flow_df
 
     @staticmethod
     def align_source_target_ids(flow_df):
-        ids = set(flow_df['source'].dropna()).union(set(flow_df['target'].dropna()))
+        ids = pd.concat([flow_df['source'], flow_df['target']]).dropna()
+        min_, max_ = ids.min(), ids.max()
 
         # In case of fragments we want to be able to connects fragments to one another
-        for index, row in flow_df[flow_df['operation_type'] == 'RemoteSource'].iterrows():  # TODO
-            fragment_id_to_look_for = row['label'][-2]
-            current_source_id = row['source']
-            flow_df.loc[
-                (flow_df['fragment_id'] == fragment_id_to_look_for) & (flow_df['target'].isna()), 'target'
-            ] = current_source_id
+        remote_sources = flow_df[flow_df['operation_type'] == 'RemoteSource']
+        if not remote_sources.empty:
+            fragment_keys = ['query_hash', 'fragment_id'] if 'query_hash' in flow_df.columns else ['fragment_id']
+
+            # A remote source may read several fragments e.g. `remote_source [10, 11]`
+            fragment_links = (
+                remote_sources.assign(fragment_id=remote_sources['label'].str.extract(r'\[(.*)\]')[0].str.split(','))
+                .explode('fragment_id')
+                .assign(fragment_id=lambda x: x.fragment_id.str.strip())
+                .drop_duplicates(fragment_keys)[[*fragment_keys, 'source']]
+            )
+            fragment_roots = (
+                flow_df.loc[flow_df['target'].isna(), fragment_keys]
+                .reset_index()
+                .merge(fragment_links, on=fragment_keys)
+            )
+            flow_df.loc[fragment_roots['index'], 'target'] = fragment_roots['source'].to_numpy()
 
         # Give last operators the biggest id so no reuse of the same label later
-        max_ = max(ids) + 1
-        for index, _ in flow_df[flow_df['target'].isna()].iterrows():
-            flow_df.loc[index, 'target'] = max_
-            max_ += 1
+        is_last_operator = flow_df['target'].isna()
+        flow_df.loc[is_last_operator, 'target'] = max_ + 1 + np.arange(is_last_operator.sum())
 
         # Normalize ids to start with zero
-        min_ = min(ids)
         flow_df = (
             flow_df.assign(
-                target=lambda x: x.target.map(lambda y: y - min_).astype(int),
-                source=lambda x: x.source.map(lambda y: y - min_).astype(int),
+                target=lambda x: (x.target - min_).astype(int),
+                source=lambda x: (x.source - min_).astype(int),
             )
             .sort_values(by='source')
             .reset_index(drop=True)
@@ -1,3 +1,4 @@
+import json
 from operator import itemgetter
 
 try:
@@ -73,10 +74,10 @@ class PostgresParser(DBParser):
         'Subquery Scan': 'A Subquery Scan is for scanning the output of a sub-query in the range table.',
     }
 
-    def __init__(self, is_compact=False, execute_query=True):
+    def __init__(self, is_compact=False, execute_query=True, **kwargs):
         self.query_prefix = self.explain_analyze_prefix if execute_query else self.explain_prefix
 
-        super().__init__(is_compact)
+        super().__init__(is_compact, **kwargs)
 
     def node_type_extractor(self, node):
         return node['Node Type']
@@ -84,6 +85,20 @@ class PostgresParser(DBParser):
     def execution_plan_extractor(self, node):
         return node['Plan']
 
+    def load_execution_plan(self, plan_text):
+        """
+        Plans are saved either as the output of `EXPLAIN (FORMAT JSON)` (a list holding the plan) or as its root node.
+
+        >>> PostgresParser().load_execution_plan('[{"Plan": {"Node Type": "Result"}, "Planning Time": 0.1}]')
+        {'Node Type': 'Result'}
+        >>> PostgresParser().load_execution_plan('{"Node Type": "Result"}')
+        {'Node Type': 'Result'}
+        """
+        execution_plan = json.loads(plan_text)
+        if isinstance(execution_plan, list):
+            execution_plan = execution_plan[0]
+        return self.execution_plan_extractor(execution_plan) if 'Plan' in execution_plan else execution_plan
+
     def filter_indicator(self, node):
         return 'Filter' in node
 
@@ -135,7 +150,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_limit(1000, {"Node Type": "Limit", "Actual Rows": 5})
-        ([ParsedNode(source=9999, target=1000, operation_type='Limit', label='LIMIT 5', label_metadata='LIMIT: 5')], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='Limit', label='LIMIT 5', label_metadata='LIMIT: 5')], 0)
         """
         return {
             'label': f"LIMIT {execution_node.get('Actual Rows', '')}",
@@ -147,7 +162,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_sort(1000, {"Node Type": "Sort", "Sort Key": ["crew.title_id"], "Sort Method": "quicksort", "Sort Space Used": 128, "Sort Space Type": "Memory"})
-        ([ParsedNode(source=9999, target=1000, operation_type='Sort', label='SORT', label_metadata="Sort Space Type: Memory\\nSort Space Used: 128\\nSort Method: quicksort\\nSort Key: ['crew.title_id']\\n")], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='Sort', label='SORT', label_metadata="Sort Space Type: Memory\\nSort Space Used: 128\\nSort Method: quicksort\\nSort Key: ['crew.title_id']\\n")], 0)
         """
 
         return {
@@ -163,7 +178,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_append(1000, {"Node Type": "Append"})
-        ([ParsedNode(source=9999, target=1000, operation_type='Append', label='UNION ALL', label_metadata='')], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='Append', label='UNION ALL', label_metadata='')], 0)
         """
 
         return {
@@ -178,7 +193,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_window(1000, {"Node Type": "WindowAgg"})
-        ([ParsedNode(source=9999, target=1000, operation_type='WindowAgg', label='WINDOW', label_metadata='')], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='WindowAgg', label='WINDOW', label_metadata='')], 0)
         """
         return {
             'label': 'WINDOW',
@@ -190,7 +205,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_set_op(1000, {"Node Type": "SetOp", "Strategy": "Hashed", "Command": "Intersect All"})
-        ([ParsedNode(source=9999, target=1000, operation_type='SetOp', label='SetOp', label_metadata='Strategy:Hashed\\nCommand:Intersect All\\n')], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='SetOp', label='SetOp', label_metadata='Strategy:Hashed\\nCommand:Intersect All\\n')], 0)
         """
         return {
             'label': 'SetOp',
@@ -202,7 +217,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_unique(1000, {"Node Type": "Unique"})
-        ([ParsedNode(source=9999, target=1000, operation_type='Unique', label='Unique', label_metadata='')], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='Unique', label='Unique', label_metadata='')], 0)
         """
         return {
             'label': 'Unique',
@@ -214,7 +229,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_result(1000, {"Node Type": "Result"})
-        ([ParsedNode(source=9999, target=1000, operation_type='Result', label='Result', label_metadata='')], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='Result', label='Result', label_metadata='')], 0)
         """
         return {
             'label': 'Result',
@@ -226,7 +241,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_gather(1000, {"Node Type": "Gather", "Workers Launched": 2, "Workers Planned": 2})
-        ([ParsedNode(source=9999, target=1000, operation_type='Gather', label='Gather', label_metadata='Workers Planned:2\\nWorkers Launched:2\\n')], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='Gather', label='Gather', label_metadata='Workers Planned:2\\nWorkers Launched:2\\n')], 0)
         """
         res = {'label': 'Gather', 'label_metadata': f'Workers Planned:{execution_node["Workers Planned"]}\n'}
 
@@ -241,7 +256,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_hash(1000, {"Node Type": "Hash", "Parent Relationship": "Inner"})
-        ([ParsedNode(source=9999, target=1000, operation_type='Hash', label='HASH', label_metadata='')], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='Hash', label='HASH', label_metadata='')], 0)
         """
         res = {'label': 'HASH', 'label_metadata': ''}
 
@@ -263,10 +278,10 @@ class PostgresParser(DBParser):
         >>> p = PostgresParser(True)
 
         >>> p.parse_join(1000, {"Node Type": "Nested Loop",  "Join Type": "Inner", "Join Filter": "(crew.title_id = titles.title_id)"})
-        ([ParsedNode(source=9999, target=1000, operation_type='Nested Loop', label='JOIN', label_metadata='Inner Join with (crew.title_id = titles.title_id)')], 9999)
+        ([ParsedNode(source=0, target=1000, operation_type='Nested Loop', label='JOIN', label_metadata='Inner Join with (crew.title_id = titles.title_id)')], 0)
 
         >>> p.parse_join(1000, {"Node Type": "Hash Join",  "Join Type": "Inner", "Join Filter": "(crew.person_id = people.person_id)"})
-        ([ParsedNode(source=9998, target=1000, operation_type='Hash Join', label='JOIN', label_metadata='Inner Join with (crew.person_id = people.person_id)')], 9998)
+        ([ParsedNode(source=1, target=1000, operation_type='Hash Join', label='JOIN', label_metadata='Inner Join with (crew.person_id = people.person_id)')], 1)
         """
         cond_key = [key for key in execution_node.keys() if 'Cond' in key or 'Join Filter' == key]
         metadata = f"{execution_node['Join Type']} Join"
@@ -282,7 +297,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_scan(1000, {"Node Type": "Seq Scan", "Relation Name": "people", "Actual Rows": 3, "Filter": "people.age = 30", "Rows Removed by Filter": 3446258})
-        ([ParsedNode(source=9999, target=1000, operation_type='Where', label='People*', label_metadata='Filter condition: people.age = 30'), ParsedNode(source=9998, target=9999, operation_type='Seq Scan', label='People', label_metadata='')], 9998)
+        ([ParsedNode(source=0, target=1000, operation_type='Where', label='People*', label_metadata='Filter condition: people.age = 30'), ParsedNode(source=1, target=0, operation_type='Seq Scan', label='People', label_metadata='')], 1)
         """
 
         def parse_where(execution_node):
@@ -315,7 +330,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_subquery(1000, {"Node Type": "Subquery Scan", "Actual Rows": 3, "Filter": "people.age = 30", "Rows Removed by Filter": 3446258, "Alias": "a"})
-        ([ParsedNode(source=9999, target=1000, operation_type='Where', label='a*', label_metadata='Filter condition: people.age = 30'), ParsedNode(source=9998, target=9999, operation_type='Subquery Scan', label='a', label_metadata='')], 9998)
+        ([ParsedNode(source=0, target=1000, operation_type='Where', label='a*', label_metadata='Filter condition: people.age = 30'), ParsedNode(source=1, target=0, operation_type='Subquery Scan', label='a', label_metadata='')], 1)
         """
 
         def parse_naive_sub_query(execution_node):
@@ -342,7 +357,7 @@ class PostgresParser(DBParser):
         """
         >>> p = PostgresParser(True)
         >>> p.parse_aggregate(9996, {"Node Type": "aggregate", "Actual Rows": 3, "Filter": "(count(1) > 5)", "Rows Removed by Filter": 34,  "Group Key": ["titles.genres"], "Output": ["titles.genres"], "Partial Mode": "Simple", "Strategy": "Plain"})
-        ([ParsedNode(source=9999, target=9996, operation_type='Having', label='AGG*', label_metadata='Filter condition: (count(1) > 5)'), ParsedNode(source=9998, target=9999, operation_type='aggregate', label='AGG', label_metadata="Output: ['titles.genres']\\nPartial Mode: Simple\\nStrategy: Plain\\nGroup key: ['titles.genres']")], 9998)
+        ([ParsedNode(source=0, target=9996, operation_type='Having', label='AGG*', label_metadata='Filter condition: (count(1) > 5)'), ParsedNode(source=1, target=0, operation_type='aggregate', label='AGG', label_metadata="Output: ['titles.genres']\\nPartial Mode: Simple\\nStrategy: Plain\\nGroup key: ['titles.genres']")], 1)
         """
 
         def parse_having(execution_node):
@@ -370,38 +385,30 @@ class PostgresParser(DBParser):
         yield parse_naive_aggregate
 
     def enrich_stats(self, df):
-        df['estimated_cost'] = df['total_cost']
+        is_analyzed = 'actual_startup_time' in df.columns
+        aggregations = {'sub_operations': ('source', 'size'), 'max_total_cost': ('total_cost', 'max')}
+        if is_analyzed:
+            aggregations.update(
+                max_actual_total_time=('actual_total_time', 'max'),
+                sum_actual_rows=('actual_rows', 'sum'),
+            )
+        sub_operations_stats = DBParser.aggregate_sub_operations(df, **aggregations)
+        has_sub_operations = sub_operations_stats['sub_operations'].notna()
+
+        # Operations report their stats inclusive of their sub-operations, so the heaviest one is subtracted
+        max_total_cost = sub_operations_stats['max_total_cost'].where(has_sub_operations, 0)
+        df['estimated_cost'] = df['total_cost'] - max_total_cost
         df['redundent_operation'] = False
 
-        if 'actual_startup_time' in df.columns:
-            df['actual_startup_duration'] = df['actual_startup_time']
-            df['actual_duration'] = df['actual_total_time']
-
-        for i, row in df.iterrows():
-            relevant_ops = df.query(f"target=={row['source']} & query_hash=='{row['query_hash']}'")
-            if 'actual_startup_time' in df.columns:
-                df.loc[i, 'actual_duration'] = (
-                    row.actual_total_time
-                    if relevant_ops.empty
-                    else row.actual_total_time - max(relevant_ops.actual_total_time)
-                )
-                df.loc[i, 'actual_startup_duration'] = (
-                    row.actual_startup_time
-                    if relevant_ops.empty
-                    else row.actual_startup_time - max(relevant_ops.total_cost)
-                )
-
-            df.loc[i, 'estimated_cost'] = (
-                row.total_cost if relevant_ops.empty else row.total_cost - max(relevant_ops.total_cost)
+        if is_analyzed:
+            max_actual_total_time = sub_operations_stats['max_actual_total_time'].where(has_sub_operations, 0)
+            df['actual_startup_duration'] = df['actual_startup_time'] - max_total_cost
+            df['actual_duration'] = df['actual_total_time'] - max_actual_total_time
+            df['redundent_operation'] = df['operation_type'].isin(self.redundent_operation_names) & (
+                sub_operations_stats['sum_actual_rows'].fillna(0) == df['actual_rows']
             )
 
-            if row.operation_type in self.redundent_operation_names and 'actual_startup_time' in df.columns:
-                df.loc[i, 'redundent_operation'] = sum(relevant_ops.actual_rows) == row.actual_rows
-
-            if any(op in row.label.split(' ') for op in self.label_replacement.keys()):
-                df.loc[i, 'label'] = self.label_replacement[row.label].join(
-                    relevant_ops.label,
-                )
+        df = self.merge_operation_labels(df)
 
         df['estimated_cost_pct'] = calc_precentage(df['estimated_cost'], df['total_cost'])
         if 'actual_startup_time' in df.columns:
@@ -1,4 +1,5 @@
 import random
+from functools import lru_cache
 
 from colour import RGB_TO_COLOR_NAMES, Color
 
@@ -40,21 +41,42 @@ def color_range(c, n, by='luminance', min_value=0.5, max_value=0.85):
         yield optimize_color(c, by, value)
 
 
-def sample_colors(n):
+@lru_cache(maxsize=None)
+def palette(c, n, by='luminance'):
     """
+    The `color_range` of a color, computed once per color and size.
+
+    >>> palette('red', 3)
+    ('#ffb2b2', '#f77', '#ff3b3b')
+    """
+    return tuple(color_range(c, n, by))
+
+
+def sample_colors(n, seed=0):
+    """
+    Picks `n` distinct colors, the same ones for the same `n` and `seed`.
+
     >>> sample_colors(0)
     []
-    >>> len(sample_colors(2))
-    2
+    >>> sample_colors(2)
+    ['yellow', 'green']
+    >>> sample_colors(10) == sample_colors(10)
+    True
     """
     if n <= 7:
         colors = ['yellow', 'green', 'khaki', 'red', 'purple', 'orange', 'silver']
     else:
-        colors = [color[0] for color in RGB_TO_COLOR_NAMES.values()]
-        random.shuffle(colors)
+        colors = list(_shuffled_color_names(seed))
     return colors[:n]
 
 
+@lru_cache(maxsize=None)
+def _shuffled_color_names(seed):
+    color_names = [color[0] for color in RGB_TO_COLOR_NAMES.values()]
+    random.Random(seed).shuffle(color_names)
+    return tuple(color_names)
+
+
 if __name__ == '__main__':
     import doctest
 
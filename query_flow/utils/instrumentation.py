@@ -0,0 +1,115 @@
+import collections
+import contextlib
+import cProfile
+import pstats
+import threading
+import time
+
+import pandas as pd
+
+__all__ = ['StageMetrics', 'measure_stage', 'profile_call']
+
+StageRecord = collections.namedtuple('StageRecord', ['stage', 'seconds', 'nodes', 'rows', 'memory'])
+
+
+class StageMetrics:
+    """
+    Collects the stages reported by the parsers and the vizualizers (see their `instrumentation` argument): how long
+    every stage took, how many plan nodes it handled and the rows and memory of the frame it produced.
+    Stages may contain others, e.g. `parse` contains `parse_nodes`, `align_source_target_ids` and `enrich_stats`.
+    Any object with the same `record` method can be used instead, e.g. to send the stages to a metrics service.
+
+    >>> metrics = StageMetrics()
+    >>> metrics.record('parse_nodes', 0.5, nodes=10)
+    >>> metrics.record('enrich_stats', 0.25, rows=12, memory=2 ** 20)
+    >>> metrics.record('parse_nodes', 0.25, nodes=20)
+    >>> metrics.summary()[['calls', 'seconds', 'max_seconds', 'nodes', 'rows', 'memory_mb']].rename_axis(None)
+                  calls  seconds  max_seconds  nodes  rows  memory_mb
+    parse_nodes       2     0.75         0.50     30  <NA>        NaN
+    enrich_stats      1     0.25         0.25   <NA>    12        1.0
+    """
+
+    summary_columns = ['calls', 'seconds', 'mean_seconds', 'max_seconds', 'nodes', 'rows', 'memory_mb']
+
+    def __init__(self):
+        self.records = []
+        # Queries report their stages from the threads of `QueryVizualizer.collect_execution_plans`
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, nodes=None, rows=None, memory=None):
+        with self._lock:
+            self.records.append(StageRecord(stage, seconds, nodes, rows, memory))
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+    def summary(self):
+        """A row per stage, in the order the stages first ran. Nodes are summed, rows and memory are the largest."""
+        if not self.records:
+            return pd.DataFrame(columns=self.summary_columns, index=pd.Index([], name='stage'))
+        records = pd.DataFrame(self.records, columns=StageRecord._fields)
+        summary = records.groupby('stage', sort=False).agg(
+            calls=('seconds', 'size'),
+            seconds=('seconds', 'sum'),
+            mean_seconds=('seconds', 'mean'),
+            max_seconds=('seconds', 'max'),
+            nodes=('nodes', lambda nodes: nodes.sum(min_count=1)),
+            rows=('rows', 'max'),
+            memory_mb=('memory', lambda memory: memory.max() / 2 ** 20),
+        )
+        return summary.astype({'nodes': 'Int64', 'rows': 'Int64'})
+
+    def to_string(self):
+        return self.summary().to_string(float_format=lambda value: f'{value:,.3f}')
+
+
+@contextlib.contextmanager
+def measure_stage(instrumentation, stage):
+    """
+    Times the block as `stage` and reports it to `instrumentation` (nothing is measured when it is None).
+    The block can report the plan nodes it handled as `stats['nodes']` and the frame it produced as `stats['frame']`,
+    whose size is measured after the block is timed.
+
+    >>> metrics = StageMetrics()
+    >>> with measure_stage(metrics, 'melt') as stats:
+    ...     stats['frame'] = pd.DataFrame({'value': range(4)})
+    >>> metrics.records[0].stage, metrics.records[0].rows, metrics.records[0].memory >= 4 * 8
+    ('melt', 4, True)
+    """
+    stats = {}
+    if instrumentation is None:
+        yield stats
+        return
+
+    start = time.perf_counter()
+    yield stats
+    seconds = time.perf_counter() - start
+    frame = stats.get('frame')
+    rows = None if frame is None else len(frame)
+    memory = None if frame is None else int(frame.memory_usage(index=True, deep=True).sum())
+    instrumentation.record(stage, seconds, nodes=stats.get('nodes'), rows=rows, memory=memory)
+
+
+def profile_call(func, *args, **kwargs):
+    """
+    Runs a single call under cProfile, returns its result and the profile as `pstats.Stats`
+    (e.g. `.sort_stats('cumulative').print_stats(20)` or `.dump_stats(path)` for snakeviz).
+
+    >>> result, stats = profile_call(sorted, [3, 1, 2])
+    >>> result, stats.total_calls > 0
+    ([1, 2, 3], True)
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+    return result, pstats.Stats(profiler)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -1,20 +1,33 @@
 import numpy as np
+import pandas as pd
 
 
 def calc_precentage(series, comsum_series):
-    return series / comsum_series * 100
+    """
+    Percentage of `series` out of `comsum_series`, zero totals have no percentage (NaN).
+
+    >>> calc_precentage(pd.Series([1, 0, 5, 2]), pd.Series([4, 0, 0, np.nan])).tolist()
+    [25.0, nan, nan, nan]
+    """
+    totals = comsum_series.to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precentage = np.where(totals == 0, np.nan, series.to_numpy(dtype=float) / totals * 100)
+    return pd.Series(precentage, index=series.index)
 
 
 def calc_ratio(df, column_a, column_b):
-    def calc_row(this, other):
-        if this == other:
-            return 1
-        elif this == 0 or other == 0:
-            return np.inf
-        else:
-            return max([this, other]) / min([this, other])
-
-    return df.apply(lambda x: calc_row(x[column_a], x[column_b]), axis=1)
+    """
+    Ratio of the bigger to the smaller value of the columns, 1 when they are equal and inf when only one is zero.
+    NaN values have no ratio.
+
+    >>> calc_ratio(pd.DataFrame({'a': [2, 0, 0, 3, np.nan], 'b': [2, 0, 4, 12, 1]}), 'a', 'b').tolist()
+    [1.0, 1.0, inf, 4.0, nan]
+    """
+    this, other = df[column_a].to_numpy(dtype=float), df[column_b].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.maximum(this, other) / np.minimum(this, other)
+    ratio = np.where(this == other, 1.0, np.where((this == 0) | (other == 0), np.inf, ratio))
+    return pd.Series(ratio, index=df.index)
 
 
 def listify(val):
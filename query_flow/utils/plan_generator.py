@@ -0,0 +1,176 @@
+"""
+Seeded synthetic execution plans, shaped like the Postgres and Athena plans the parsers read (e.g. to benchmark or test
+the parsers on plans of any size).
+
+Both generators build a random tree of `n_nodes` operations where every operation has at most `fan_out` children and
+lies at most `max_depth` levels under the root. About `filter_ratio` of the scans (and Postgres aggregates) filter
+their rows. The same arguments and `seed` always generate the same plan.
+"""
+import random
+
+__all__ = ['make_tree', 'make_postgres_plan', 'make_athena_plan', 'count_nodes']
+
+
+def make_tree(n_nodes, fan_out=3, max_depth=None, seed=0):
+    """
+    Returns the children (positions) of every node, root first and every node after its parent.
+
+    >>> make_tree(6, fan_out=2, seed=1)
+    [[1, 2], [4], [3], [], [5], []]
+    >>> make_tree(3, fan_out=2, max_depth=1)
+    [[1, 2], [], []]
+    """
+    rng = random.Random(seed)
+    children, depths, open_nodes = [[]], [0], [0] if max_depth != 0 else []
+    while len(children) < n_nodes:
+        if not open_nodes:
+            raise ValueError(f"{n_nodes} nodes don't fit in max_depth={max_depth} with fan_out={fan_out}")
+
+        # Attaching to a random open node grows random trees, whose depth is logarithmic in the number of nodes
+        open_position = rng.randrange(len(open_nodes))
+        parent = open_nodes[open_position]
+        node = len(children)
+        children[parent].append(node)
+        children.append([])
+        depths.append(depths[parent] + 1)
+        if len(children[parent]) == fan_out:
+            open_nodes[open_position] = open_nodes[-1]
+            open_nodes.pop()
+        if max_depth is None or depths[node] < max_depth:
+            open_nodes.append(node)
+    return children
+
+
+def make_postgres_plan(n_nodes, fan_out=3, max_depth=None, filter_ratio=0.2, seed=0):
+    """
+    A Postgres `EXPLAIN (ANALYZE, FORMAT JSON)` plan (its root node, see `PostgresParser.execution_plan_extractor`).
+
+    >>> plan = make_postgres_plan(100, seed=3)
+    >>> count_nodes(plan), plan == make_postgres_plan(100, seed=3), plan == make_postgres_plan(100, seed=4)
+    (100, True, False)
+    """
+    rng = random.Random(seed)
+    children = make_tree(n_nodes, fan_out, max_depth, seed)
+    nodes = [None] * n_nodes
+    for position in reversed(range(n_nodes)):
+        sub_nodes = [nodes[child] for child in children[position]]
+        if not sub_nodes:
+            node = {'Node Type': rng.choice(['Seq Scan', 'Index Scan']), 'Relation Name': f'table_{position}'}
+            actual_rows = int(rng.lognormvariate(8, 2))
+        elif len(sub_nodes) == 1:
+            node = dict(rng.choice(_postgres_single_child_nodes))
+            actual_rows = int(sub_nodes[0]['Actual Rows'] * rng.uniform(0.1, 1.0))
+        else:
+            node_type = 'Append' if len(sub_nodes) > 2 else rng.choice(['Hash Join', 'Merge Join', 'Nested Loop'])
+            node = {'Node Type': node_type, 'Join Type': 'Inner'}
+            actual_rows = int(max(sub_node['Actual Rows'] for sub_node in sub_nodes) * rng.uniform(0.1, 2.0))
+
+        if node['Node Type'] in ('Seq Scan', 'Index Scan', 'Aggregate') and rng.random() < filter_ratio:
+            node.update({'Filter': '(value > 0)', 'Rows Removed by Filter': int(actual_rows * rng.uniform(0.1, 10))})
+        startup_cost = sum(sub_node['Total Cost'] for sub_node in sub_nodes)
+        startup_time = max([sub_node['Actual Total Time'] for sub_node in sub_nodes], default=0.0)
+        node.update(
+            {
+                'Startup Cost': round(startup_cost, 2),
+                'Total Cost': round(startup_cost + actual_rows * rng.uniform(0.01, 0.1), 2),
+                'Plan Rows': int(actual_rows * rng.lognormvariate(0, 1)),
+                'Plan Width': rng.choice([4, 8, 16, 32]),
+                'Actual Startup Time': round(startup_time, 3),
+                'Actual Total Time': round(startup_time + actual_rows * rng.uniform(0.0001, 0.001), 3),
+                'Actual Rows': actual_rows,
+                'Actual Loops': 1,
+            }
+        )
+        if sub_nodes:
+            node['Plans'] = sub_nodes
+        nodes[position] = node
+    return nodes[0]
+
+
+_postgres_single_child_nodes = [
+    {'Node Type': 'Hash'},
+    {
+        'Node Type': 'Sort',
+        'Sort Key': ['id'],
+        'Sort Method': 'quicksort',
+        'Sort Space Used': 25,
+        'Sort Space Type': 'Memory',
+    },
+    {'Node Type': 'Aggregate', 'Strategy': 'Hashed', 'Partial Mode': 'Simple', 'Group Key': ['id'], 'Output': ['id']},
+    {'Node Type': 'Gather', 'Workers Planned': 2},
+    {'Node Type': 'Limit'},
+]
+
+
+def make_athena_plan(n_nodes, fan_out=3, max_depth=None, filter_ratio=0.2, fragment_depth=4, seed=0):
+    """
+    An Athena `EXPLAIN ANALYZE (FORMAT JSON)` plan. Every `fragment_depth` levels the operations move to a fragment of
+    their own, read by a `RemoteSource` of the parent fragment (so the plan has a few more operations than `n_nodes`).
+
+    >>> plan = make_athena_plan(100, seed=3)
+    >>> len(plan['fragments']) > 1, count_nodes(plan) - len(plan['fragments']) + 1
+    (True, 100)
+    """
+    rng = random.Random(seed)
+    children = make_tree(n_nodes, fan_out, max_depth, seed)
+    nodes, depths, fragments = [None] * n_nodes, [0] * n_nodes, []
+    for position, node_children in enumerate(children):
+        for child in node_children:
+            depths[child] = depths[position] + 1
+
+    for position in reversed(range(n_nodes)):
+        sub_nodes = [nodes[child] for child in children[position]]
+        if not sub_nodes:
+            output_rows = int(rng.lognormvariate(8, 2))
+            node = _athena_node('TableScan', f'[table = awsdatacatalog:HiveTableHandle{{tableName=table_{position}}}]')
+            if rng.random() < filter_ratio:
+                input_rows = int(max(output_rows, 1) * rng.uniform(1.1, 10))
+                filtered = 100 * (1 - output_rows / input_rows)
+                node.update(
+                    name='ScanFilterProject',
+                    details=f'Input: {input_rows} rows ({input_rows / 10:.2f}kB), Filtered: {filtered:.2f}%\n',
+                )
+        else:
+            sub_rows = [_athena_rows(sub_node) for sub_node in sub_nodes]
+            output_rows = int(max(sub_rows) * rng.uniform(0.1, 1.0 if len(sub_nodes) == 1 else 2.0))
+            node_names = ['Project', 'LocalExchange', 'Aggregate', 'Limit'] if len(sub_nodes) == 1 else ['InnerJoin']
+            node = _athena_node(rng.choice(node_names), '[]')
+            node['children'] = sub_nodes
+
+        node['distributedNodeStats'] = {
+            'nodeCpuTime': f'{output_rows * rng.uniform(0.0001, 0.001):.2f}ms',
+            'nodeCpuFraction': f'{rng.uniform(0, 10):.2f}%',
+            'nodeOutputRows': f'{output_rows} rows',
+            'nodeOutputDataSize': f'{output_rows / 10:.2f}kB',
+        }
+        if position and depths[position] % fragment_depth == 0:
+            fragment_id = str(len(fragments) + 1)
+            fragments.append({'id': fragment_id, 'logicalPlan': {'1': [node]}})
+            node = _athena_node('RemoteSource', f'[{fragment_id}]')
+            node['distributedNodeStats'] = dict(fragments[-1]['logicalPlan']['1'][0]['distributedNodeStats'])
+        nodes[position] = node
+
+    fragments.append({'id': '0', 'logicalPlan': {'1': [nodes[0]]}})
+    return {'fragments': fragments[::-1]}
+
+
+def _athena_node(name, identifier):
+    return {'name': name, 'identifier': identifier, 'outputs': [], 'details': '', 'children': []}
+
+
+def _athena_rows(node):
+    return int(node['distributedNodeStats']['nodeOutputRows'].split()[0])
+
+
+def count_nodes(execution_plan):
+    """Operations of a Postgres or an Athena plan."""
+    if 'fragments' in execution_plan:
+        pending_nodes = [fragment['logicalPlan']['1'][0] for fragment in execution_plan['fragments']]
+    else:
+        pending_nodes = [execution_plan]
+    n_nodes = 0
+    while pending_nodes:
+        node = pending_nodes.pop()
+        n_nodes += 1
+        pending_nodes.extend(node.get('Plans', node.get('children', [])))
+    return n_nodes
@@ -0,0 +1,217 @@
+import collections
+import math
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['collapse_flow_df']
+
+collapsed_operation_type = 'Collapsed'
+max_label_length = 80
+
+
+def collapse_flow_df(flow_df, metric, min_share=0.0, max_nodes=None):
+    """
+    Level of detail for big plans, operations whose subtree holds less than `min_share` of the total `metric` are
+    collapsed (with their subtree) into a single aggregate operation per parent and query.
+    With `max_nodes` only the operations on the heaviest paths are kept, so at most `max_nodes` operations (aggregates
+    included, at least one) are left regardless of the plan size. When even the query roots don't fit, the lightest
+    queries are collapsed whole into a single aggregate operation (a link per query). Ids of the returned flow are
+    dense again, and labels (that list every table of the subtree for joins) are cut to `max_label_length`.
+
+    >>> flow_df = pd.DataFrame(
+    ...     {
+    ...         'source': [0, 1, 2, 3],
+    ...         'target': [3, 3, 3, 4],
+    ...         'label': ['a', 'b', 'c', 'root'],
+    ...         'query_hash': 'q',
+    ...         'actual_rows': [90, 4, 6, 100],
+    ...     }
+    ... )
+    >>> collapse_flow_df(flow_df, 'actual_rows', min_share=0.05)[['source', 'target', 'label', 'actual_rows']]
+       source  target         label  actual_rows
+    0       0       1             a           90
+    1       1       2          root          100
+    2       3       1  2 operations           10
+    """
+    if not min_share and max_nodes is None:
+        return flow_df
+
+    kept_nodes, anchors = _select_nodes(flow_df, metric, min_share, max_nodes)
+    if max_nodes is not None and _nodes_number(kept_nodes, anchors) > max_nodes:
+        flow_df = _collapse_queries(flow_df, metric, max_nodes)
+        kept_nodes, anchors = _select_nodes(flow_df, metric, min_share, max_nodes)
+    is_kept = flow_df['source'].isin(kept_nodes)
+    if is_kept.all():
+        return _shorten_labels(_densify_ids(flow_df))
+
+    collapsed = flow_df[~is_kept]
+    collapsed = collapsed.assign(target=collapsed['source'].map(anchors), is_top=collapsed['target'].isin(kept_nodes))
+    group_keys = [collapsed['target'], collapsed['query_hash']]
+    # Compact dtypes store the query_hash as a categorical, only its (target, query_hash) pairs are grouped
+    groups = collapsed.groupby(group_keys, sort=False, observed=True)
+    metric_columns = _metric_columns(flow_df)
+    operations = groups.size()
+    top_collapsed = collapsed[collapsed['is_top']]
+    aggregated = top_collapsed.groupby(['target', 'query_hash'], sort=False, observed=True)[metric_columns].sum()
+    aggregated = aggregated.reindex(operations.index, fill_value=0).reset_index()
+    collapsed_weights = collapsed[metric].abs().groupby(group_keys, sort=False, observed=True).sum()
+    shares = (collapsed_weights / flow_df[metric].abs().sum()).to_numpy()
+
+    # One aggregate operation per parent, compact flows share it between the queries (a link per query)
+    aggregated['source'] = pd.factorize(aggregated['target'])[0] + int(flow_df[['source', 'target']].max().max()) + 1
+    aggregated['operation_type'] = collapsed_operation_type
+    aggregated['label'] = [f'{operations_number} operations' for operations_number in operations]
+    aggregated['label_metadata'] = [
+        f'\nDescription: {operations_number} collapsed operations, holding {share:.1%} of the {metric}.'
+        for operations_number, share in zip(operations, shares)
+    ]
+    if 'redundent_operation' in flow_df:
+        aggregated['redundent_operation'] = False
+
+    flow_df = pd.concat([flow_df[is_kept], aggregated[flow_df.columns.intersection(aggregated.columns)]])
+    return _shorten_labels(_densify_ids(flow_df))
+
+
+def _collapse_queries(flow_df, metric, max_nodes):
+    """
+    Collapses the fewest lightest queries that make the query roots fit `max_nodes`. Every collapsed query is left
+    with a link (carrying its root metrics) from a single aggregate operation to its last operator.
+    """
+    query_weights = flow_df[metric].abs().fillna(0).groupby(flow_df['query_hash'], sort=False, observed=True).sum()
+    queries = query_weights.sort_values(kind='stable').index
+    # Fewer queries never keep more nodes, so the number of queries to collapse is binary searched
+    low, high = 1, len(queries)
+    while low < high:
+        middle = (low + high) // 2
+        collapsed_flow_df = _merge_queries(flow_df, queries[:middle], metric)
+        if _nodes_number(*_select_nodes(collapsed_flow_df, metric, 0.0, 0)) <= max_nodes:
+            high = middle
+        else:
+            low = middle + 1
+    return _merge_queries(flow_df, queries[:low], metric)
+
+
+def _merge_queries(flow_df, queries, metric):
+    is_merged = flow_df['query_hash'].isin(queries)
+    merged = flow_df[is_merged]
+    roots = merged[~merged['target'].isin(flow_df['source'])]
+    operations = merged.groupby('query_hash', sort=False, observed=True)['source'].nunique()
+    shares = merged[metric].abs().groupby(merged['query_hash'], sort=False, observed=True).sum() / (
+        flow_df[metric].abs().sum()
+    )
+
+    aggregated = roots[['target', 'query_hash', *_metric_columns(flow_df)]].copy()
+    aggregated['source'] = int(flow_df[['source', 'target']].max().max()) + 1
+    aggregated['operation_type'] = collapsed_operation_type
+    aggregated['label'] = f'{len(queries)} queries'
+    aggregated['label_metadata'] = [
+        f'\nDescription: {operations[query_hash]} collapsed operations of the query, holding '
+        f'{shares[query_hash]:.1%} of the {metric}.'
+        for query_hash in aggregated['query_hash']
+    ]
+    if 'redundent_operation' in flow_df:
+        aggregated['redundent_operation'] = False
+    return pd.concat([flow_df[~is_merged], aggregated[flow_df.columns.intersection(aggregated.columns)]])
+
+
+def _metric_columns(flow_df):
+    return [column for column in flow_df.select_dtypes('number').columns if column not in ('source', 'target')]
+
+
+def _nodes_number(kept_nodes, anchors):
+    """The kept operations and an aggregate per anchor of the collapsed ones."""
+    return len(kept_nodes) + len({anchor for node, anchor in anchors.items() if node not in kept_nodes})
+
+
+def _select_nodes(flow_df, metric, min_share, max_nodes):
+    """
+    Picks the nodes to keep, heaviest paths first. A node is as heavy as the lightest subtree on its path to the root,
+    so every kept node has its ancestors kept. Returns them with the nearest kept ancestor (anchor) of every node.
+    """
+    weights = flow_df[metric].abs().fillna(0).groupby(flow_df['source']).sum().to_dict()
+    children, parents = collections.defaultdict(list), collections.defaultdict(list)
+    edges = flow_df.loc[flow_df['target'].isin(weights) & (flow_df['source'] != flow_df['target'])]
+    for source, target in edges[['source', 'target']].drop_duplicates().itertuples(index=False):
+        children[target].append(source)
+        parents[source].append(target)
+
+    # Leaves first, every node after its children (nodes on cycles are never reached and always kept)
+    bottom_up = [node for node in weights if not children[node]]
+    pending_children = {node: len(children[node]) for node in weights}
+    subtree_weights = dict(weights)
+    for node in bottom_up:
+        for parent in parents[node]:
+            subtree_weights[parent] += subtree_weights[node]
+            pending_children[parent] -= 1
+            if not pending_children[parent]:
+                bottom_up.append(parent)
+
+    priorities, depths = {node: math.inf for node in weights}, {node: 0 for node in weights}
+    for node in reversed(bottom_up):
+        if parents[node]:
+            priorities[node] = min(subtree_weights[node], *(priorities[parent] for parent in parents[node]))
+            depths[node] = 1 + min(depths[parent] for parent in parents[node])
+
+    # Query roots (in compact flows also nodes shared with other queries) and their ancestors are always kept
+    kept_nodes = {node for node in weights if priorities[node] == math.inf}
+    kept_nodes.update(flow_df.loc[~flow_df['target'].isin(weights), 'source'])
+    ancestors = [parent for node in kept_nodes for parent in parents[node]]
+    while ancestors:
+        node = ancestors.pop()
+        if node not in kept_nodes:
+            kept_nodes.add(node)
+            ancestors.extend(parents[node])
+
+    min_priority = min_share * sum(weights.values())
+    remaining_children = {node: sum(child not in kept_nodes for child in children[node]) for node in kept_nodes}
+    aggregates = sum(map(bool, remaining_children.values()))
+    candidates = sorted(set(weights) - kept_nodes, key=lambda node: (-priorities[node], depths[node]))
+    for node in candidates:
+        if priorities[node] < min_priority:
+            break
+
+        kept_parents = [parent for parent in parents[node] if parent in kept_nodes]
+        node_aggregates = aggregates + bool(children[node])
+        node_aggregates -= sum(remaining_children[parent] == 1 for parent in kept_parents)
+        if max_nodes is not None and len(kept_nodes) + 1 + node_aggregates > max_nodes:
+            break
+
+        kept_nodes.add(node)
+        remaining_children[node] = len(children[node])
+        for parent in kept_parents:
+            remaining_children[parent] -= 1
+        aggregates = node_aggregates
+
+    anchors = {node: node for node in kept_nodes}
+    for node in reversed(bottom_up):
+        if node not in anchors:
+            anchors[node] = anchors[parents[node][0]]
+    return kept_nodes, anchors
+
+
+def _densify_ids(flow_df):
+    ids = np.unique(np.concatenate([flow_df['source'].to_numpy(), flow_df['target'].dropna().to_numpy()]))
+    targets = flow_df['target'].to_numpy(dtype=float)
+    has_target = ~np.isnan(targets)
+    dense_targets = np.full(len(targets), np.nan)
+    dense_targets[has_target] = np.searchsorted(ids, targets[has_target])
+    return flow_df.assign(
+        source=np.searchsorted(ids, flow_df['source'].to_numpy()),
+        target=dense_targets if not has_target.all() else dense_targets.astype(np.int64),
+    ).reset_index(drop=True)
+
+
+def _shorten_labels(flow_df):
+    is_long = flow_df['label'].str.len() > max_label_length
+    if not is_long.any():
+        return flow_df
+    labels = flow_df['label'].astype(object)
+    shortened_labels = labels.str.slice(0, max_label_length - 1) + '…'
+    return flow_df.assign(label=labels.mask(is_long, shortened_labels))
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,87 @@
+import html
+import json
+
+from query_flow.utils.instrumentation import measure_stage
+
+__all__ = ['QueryReport']
+
+
+class QueryReport:
+    """
+    Renders many Sankey diagrams (flows x metrics) into a single offline HTML file.
+    plotly.js is embedded once for the whole report and every diagram is added as a compact JSON payload, so the report
+    opens without network access.
+
+    >>> from query_flow.parsers.postgres_parser import PostgresParser
+    >>> from query_flow.vizualizers.query_vizualizer import QueryVizualizer
+    >>> execution_plan = {'Node Type': 'Seq Scan', 'Relation Name': 'titles', 'Total Cost': 1.0, 'Plan Rows': 10}
+    >>> flow_df = PostgresParser().parse([execution_plan])
+    >>> report = QueryReport(QueryVizualizer(PostgresParser()), title='Scans')
+    >>> report = report.add(flow_df, ['estimated_cost'], title='Scan').add(flow_df, ['plan_rows'], title='Scan')
+    >>> [figure['layout']['title'] for figure in report.figures]
+    ['Scan-estimated_cost', 'Scan-plan_rows']
+    """
+
+    template = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script type="text/javascript">{plotly_js}</script>
+</head>
+<body>
+<h1>{title}</h1>
+{divs}
+<script type="text/javascript">
+var figures = [{figures}];
+figures.forEach(function (figure, index) {{
+    Plotly.newPlot('sankey-' + index, figure.data, figure.layout);
+}});
+</script>
+</body>
+</html>
+'''
+
+    def __init__(self, vizualizer, title='Query Flow'):
+        self.vizualizer = vizualizer
+        self.title = title
+        self.figures = []
+
+    def add(self, dfs, metrics, title, min_share=0.0, max_nodes=None):
+        """Adds the Sankey diagram of the flows, see `QueryVizualizer.vizualize`."""
+        self.figures.append(self.vizualizer.get_figure(dfs, metrics, title, min_share, max_nodes))
+        return self
+
+    def to_html(self):
+        from plotly.offline import get_plotlyjs  # plotly is slow to import and only needed for rendering
+
+        divs = '\n'.join(
+            f'<div id="sankey-{index}" style="height:{figure["layout"]["height"]}px; width:100%;"></div>'
+            for index, figure in enumerate(self.figures)
+        )
+        with measure_stage(self.vizualizer.instrumentation, 'serialize'):
+            figures = ',\n'.join(self._to_json(figure) for figure in self.figures)
+        return self.template.format(title=html.escape(self.title), plotly_js=get_plotlyjs(), divs=divs, figures=figures)
+
+    def write(self, filename):
+        with open(filename, 'w', encoding='utf-8') as report_file:
+            report_file.write(self.to_html())
+        return filename
+
+    @staticmethod
+    def _to_json(figure):
+        """
+        Compact JSON, safe to inline in a script tag.
+
+        >>> QueryReport._to_json({'layout': {'title': '</script>'}})
+        '{"layout":{"title":"<\\\\/script>"}}'
+        """
+        from plotly.utils import PlotlyJSONEncoder
+
+        return json.dumps(figure, cls=PlotlyJSONEncoder, separators=(',', ':')).replace('</', '<\\/')
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -1,19 +1,30 @@
 import collections
+import collections.abc
+import logging
+import time
+from concurrent import futures
 
 import numpy as np
 import pandas as pd
-from plotly.offline import iplot, plot
 
 try:
-    from query_flow.utils.coloring_utils import color_range, sample_colors
+    from query_flow.utils.coloring_utils import palette, sample_colors
+    from query_flow.utils.instrumentation import measure_stage
     from query_flow.utils.misc import listify
+    from query_flow.vizualizers.level_of_detail import collapse_flow_df
 except ImportError:
 
     # Support running doctests not as a module
-    from query_flow.utils.coloring_utils import color_range, sample_colors  # type: ignore
+    from query_flow.utils.coloring_utils import palette, sample_colors  # type: ignore
+    from query_flow.utils.instrumentation import measure_stage
     from query_flow.utils.misc import listify
+    from level_of_detail import collapse_flow_df  # type: ignore
 
-__all__ = ['QueryVizualizer']
+__all__ = ['QueryVizualizer', 'PlanResult']
+
+PlanResult = collections.namedtuple('PlanResult', ['query', 'execution_plan', 'error'])
+
+logger = logging.getLogger(__name__)
 
 
 class QueryVizualizer:
@@ -33,7 +44,7 @@ class QueryVizualizer:
     supported_metrics = {
         'actual_rows': ' Rows',
         'nodeOutputRows': ' Rows',
-        'nodeOutputDataSize': ' GB',
+        'nodeOutputDataSize': ' MB',
         'nodeCpuTime': ' Seconds',
         'actual_startup_duration': ' Seconds',
         'actual_duration': ' Seconds',
@@ -59,39 +70,96 @@ class QueryVizualizer:
     }
     special_cases_link_colors = {'empty': 'red', 'redundant': 'coral'}
 
-    def __init__(self, parser, is_colored_nodes=False, node_colors=None):
+    def __init__(self, parser, is_colored_nodes=False, node_colors=None, instrumentation=None):
         super().__init__()
         self.parser = parser
         self.is_colored_nodes = is_colored_nodes
+        # The stages are reported with the parser's by default, see `StageMetrics`
+        self.instrumentation = instrumentation if instrumentation is not None else parser.instrumentation
 
         if node_colors:
             self.node_colors = node_colors
 
-    def get_flow_df(self, queries, con_str):
-        execution_plans = [self.parser.from_query(query, con_str) for query in listify(queries)]
+    def get_flow_df(self, queries, con_str, max_workers=None, timeout=None):
+        """
+        Collects the queries execution plans and parses them into a single flow.
+        When `max_workers` is given plans are collected concurrently, and failing queries are logged and left out
+        of the flow instead of failing it, see `collect_execution_plans`.
+        """
+        if max_workers is None:
+            execution_plans = [self.parser.from_query(query, con_str) for query in listify(queries)]
+        else:
+            execution_plans = []
+            for result in self.collect_execution_plans(queries, con_str, max_workers, timeout):
+                if result.error is None:
+                    execution_plans.append(result.execution_plan)
+                else:
+                    logger.warning('Skipping query %r: %r', result.query, result.error)
         return self.parser.parse(execution_plans)
 
+    def collect_execution_plans(self, queries, con_str, max_workers=4, timeout=None):
+        """
+        Runs `parser.from_query` for the queries on a thread pool of at most `max_workers` threads.
+        Returns a `PlanResult` per query, in the queries order, holding either its execution plan or the error
+        it raised. A query running for more than `timeout` seconds gets a `TimeoutError`, it is not interrupted but
+        left to finish in the background.
+        """
+        queries = listify(queries)
+        started_at = [None] * len(queries)
+
+        def from_query(position, query):
+            started_at[position] = time.monotonic()
+            return self.parser.from_query(query, con_str)
+
+        executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        plan_futures = [executor.submit(from_query, position, query) for position, query in enumerate(queries)]
+
+        results = []
+        for position, (query, plan_future) in enumerate(zip(queries, plan_futures)):
+            try:
+                execution_plan = QueryVizualizer._wait_for_plan(plan_future, lambda: started_at[position], timeout)
+                results.append(PlanResult(query, execution_plan, None))
+            except Exception as error:
+                results.append(PlanResult(query, None, error))
+
+        executor.shutdown(wait=False)
+        return results
+
+    @staticmethod
+    def _wait_for_plan(plan_future, get_started_at, timeout):
+        if timeout is None:
+            return plan_future.result()
+
+        # The timeout applies from the moment the query starts running, not while it waits for a free worker
+        while get_started_at() is None and not plan_future.done():
+            futures.wait([plan_future], timeout=0.01)
+        if plan_future.done():
+            return plan_future.result()
+        try:
+            return plan_future.result(timeout=get_started_at() + timeout - time.monotonic())
+        except futures.TimeoutError:
+            raise TimeoutError(f"Query didn't finish within {timeout} seconds")
+
     def _enrich_colors(self, df, metrics):
-        # Apply basic coloring for queries links
-        queries_base_link_colors = sample_colors(df.query_hash.nunique())
-        df['color_link'] = 'silver'
-        if len(queries_base_link_colors) > 1:
-            df['color_link'] = (
-                df['query_hash'].astype('category').cat.codes.map(lambda code: queries_base_link_colors[code])
-            )
-
-        # Adjusting luminance according to the number of metrics
-        for color in df['color_link'].unique():
-            adjusted_colors = list(color_range(color, len(metrics)))
-            df.loc[df['color_link'] == color, 'color_link'] = (
-                df['variable'].astype('category').cat.codes.map(lambda code: adjusted_colors[code])
-            )
+        # Apply basic coloring for queries links, every query gets a base color (unless there is a single query)
+        queries_number = df.query_hash.nunique()
+        if queries_number > 1:
+            queries_base_link_colors = sample_colors(queries_number)
+            # Codes of the present queries only, a categorical query_hash (see `compact_dtypes`) may have unused ones
+            query_codes = pd.factorize(df['query_hash'], sort=True)[0]
+        else:
+            queries_base_link_colors = ['silver']
+            query_codes = np.zeros(len(df), dtype=int)
+
+        # Adjusting luminance according to the number of metrics, every (query, metric) pair is looked up in a table
+        metric_codes = df['variable'].astype('category').cat.codes.to_numpy()
+        palettes = np.array([palette(color, len(metrics)) for color in queries_base_link_colors], dtype=object)
+        link_colors = palettes[query_codes, metric_codes]
 
         # Apply special case coloring for queries link
-        what_case = df.apply(
-            lambda x: QueryVizualizer._get_case(x['variable'], x['value'], x['redundent_operation']), axis=1
-        )
-        df.loc[what_case != 'default', 'color_link'] = what_case.map(self.special_cases_link_colors)
+        cases = QueryVizualizer._get_cases(df['variable'], df['value'], df['redundent_operation'])
+        special_colors = pd.Series(cases).map(self.special_cases_link_colors).to_numpy()
+        df['color_link'] = np.where(cases == 'default', link_colors, special_colors)
 
         # Apply basic coloring for queries nodes
         if self.is_colored_nodes:
@@ -100,16 +168,32 @@ class QueryVizualizer:
             df['color_node'] = 'black'
         return df
 
-    def vizualize(self, dfs, metrics, title, open_=True):
-        metrics = metrics or self.default_metrics.keys()
+    def vizualize(self, dfs, metrics, title, open_=True, min_share=0.0, max_nodes=None):
+        """
+        Renders the flows as a Sankey diagram. For big plans use `min_share` and `max_nodes` to collapse the operations
+        holding a small share of the first metric (see `collapse_flow_df`), bounding the rendered diagram.
+        To render many diagrams into a single file use `QueryReport`.
+        """
+        figure = self.get_figure(dfs, metrics, title, min_share, max_nodes)
+        with measure_stage(self.instrumentation, 'plot'):
+            self._plot_sankey(figure, open_)
+
+    def get_figure(self, dfs, metrics, title, min_share=0.0, max_nodes=None):
+        """The Sankey diagram of the flows as a plotly figure dict (see `vizualize`)."""
+        metrics = list(metrics or self.default_metrics.keys())
         assert all(
             metric in self.supported_metrics.keys() for metric in metrics
         ), f'The only supported metrics are {self.supported_metrics}'
 
-        flow_df = self._prepare_dfs_for_sankey(dfs, metrics)
-        self._plot_sankey(flow_df, metrics, title, open_)
+        flow_df = self._prepare_dfs_for_sankey(dfs, metrics, min_share, max_nodes)
+        with measure_stage(self.instrumentation, 'figure') as stats:
+            stats['frame'] = flow_df
+            return self._make_figure(flow_df, metrics, title)
 
-    def _plot_sankey(self, flow_df, metrics, title, open_):
+    def _make_figure(self, flow_df, metrics, title):
+        # Sankey nodes are addressed by id, so their labels and colors are laid out by id (last operators included)
+        nodes = flow_df.drop_duplicates('source').set_index('source')
+        nodes = nodes.reindex(pd.RangeIndex(max(flow_df['source'].max(), flow_df['target'].max()) + 1))
         data_trace = dict(
             type='sankey',
             orientation='h',
@@ -117,13 +201,13 @@ class QueryVizualizer:
             valuesuffix=flow_df['variable'].map(self.supported_metrics),
             node=dict(
                 pad=200,
-                label=flow_df.drop_duplicates(['node_hash'])['label'] if self.parser.is_compact else flow_df['label'],
-                color=flow_df['color_node'],
+                label=nodes['label'].astype(object).fillna(''),
+                color=nodes['color_node'].astype(object).fillna('black'),
             ),
             link=dict(
                 source=flow_df['source'],
                 target=flow_df['target'],
-                value=flow_df['value'].map(np.int64).replace(0, 1),
+                value=flow_df['value'].fillna(0).astype(np.int64).replace(0, 1),  # Missing values are drawn thin too
                 label=flow_df['label_metadata'],
                 color=flow_df['color_link'],
             ),
@@ -131,7 +215,7 @@ class QueryVizualizer:
         layout = dict(
             title=f"{title}-{','.join(metrics)}",
             font=dict(size=10),
-            height=2000,  # TODO fix this too look good on all type of sizes
+            height=self._get_height(flow_df),
             updatemenus=[
                 dict(
                     y=0.6,
@@ -150,49 +234,55 @@ class QueryVizualizer:
                 ),
             ],
         )
+        return dict(data=[data_trace], layout=layout)
+
+    @staticmethod
+    def _plot_sankey(figure, open_):
+        from plotly.offline import iplot, plot  # plotly is slow to import and only needed for rendering
+
+        filename = f"{figure['layout']['title']}.html"
         if open_:  # TODO change this to two functions
-            plot(
-                dict(data=[data_trace], layout=layout),
-                validate=False,
-                filename=f"{title}-{','.join(metrics)}.html",
-                image_width=8000,
-                auto_open=False,
-            )
+            plot(figure, validate=False, filename=filename, image_width=8000, auto_open=False)
         else:
-            iplot(
-                dict(data=[data_trace], layout=layout),
-                validate=False,
-                filename=f"{title}-{','.join(metrics)}.html",
-            )
-
-    def _prepare_dfs_for_sankey(self, flow_dfs, metrics):
-        if isinstance(flow_dfs, collections.Sequence):
+            iplot(figure, validate=False, filename=filename)
+
+    def _prepare_dfs_for_sankey(self, flow_dfs, metrics, min_share=0.0, max_nodes=None):
+        if isinstance(flow_dfs, collections.abc.Sequence):
             flow_dfs = pd.concat(flow_dfs)
-        flow_dfs = flow_dfs.melt(id_vars=self.columns_pks, value_vars=metrics)
-        return self._enrich_colors(flow_dfs, metrics)
+        with measure_stage(self.instrumentation, 'level_of_detail') as stats:
+            stats['frame'] = flow_dfs = collapse_flow_df(flow_dfs, metrics[0], min_share, max_nodes)
+        with measure_stage(self.instrumentation, 'melt') as stats:
+            stats['frame'] = flow_dfs = flow_dfs.melt(id_vars=self.columns_pks, value_vars=metrics)
+        with measure_stage(self.instrumentation, 'colors') as stats:
+            stats['frame'] = flow_dfs = self._enrich_colors(flow_dfs, metrics)
+        return flow_dfs
 
     @staticmethod
-    def _get_case(metric, value, redundent_operation):
+    def _get_height(flow_df, node_height=50, min_height=600, max_height=2000):
         """
-        >>> QueryVizualizer._get_case("actual_rows", 0, True)
-        'redundant'
-
-        >>> QueryVizualizer._get_case("actual_rows", 0, False)
-        'empty'
+        The diagram grows with its leaves (the widest column of the plans) up to `max_height`.
 
-        >>> QueryVizualizer._get_case("actual_rows", 2, False)
-        'default'
-
-        >>> QueryVizualizer._get_case("cost", 0, False)
-        'default'
+        >>> QueryVizualizer._get_height(pd.DataFrame({'source': [0, 1, 2], 'target': [2, 2, 3]}))
+        600
+        >>> QueryVizualizer._get_height(pd.DataFrame({'source': range(30), 'target': 30}))
+        1500
         """
+        leaves = np.setdiff1d(flow_df['source'].to_numpy(), flow_df['target'].to_numpy())
+        return int(np.clip(node_height * len(leaves), min_height, max_height))
 
-        if redundent_operation:
-            return 'redundant'
-        elif metric == 'actual_rows' and value == 0:
-            return 'empty'
-        else:
-            return 'default'
+    @staticmethod
+    def _get_cases(metrics, values, redundent_operations):
+        """
+        >>> QueryVizualizer._get_cases(
+        ...     pd.Series(['actual_rows', 'actual_rows', 'actual_rows', 'cost']),
+        ...     pd.Series([0, 0, 2, 0]),
+        ...     pd.Series([True, False, False, False]),
+        ... )
+        array(['redundant', 'empty', 'default', 'default'], dtype='<U9')
+        """
+        is_redundant = np.asarray(redundent_operations, dtype=bool)
+        is_empty = (metrics.to_numpy() == 'actual_rows') & (values.to_numpy() == 0)
+        return np.select([is_redundant, is_empty], ['redundant', 'empty'], default='default')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+import json
+import pstats
+
+import pandas as pd
+import pytest
+
+from query_flow import cli
+from query_flow.parsers.postgres_parser import PostgresParser
+
+
+@pytest.fixture
+def expected(execution_plans):
+    return PostgresParser().parse(execution_plans)
+
+
+@pytest.mark.parametrize('options', [[], ['--compact-dtypes']], ids=['default', 'compact-dtypes'])
+def test_plan_files(multiple_queries, tmp_path, expected, options):
+    output, html = tmp_path / 'flows.csv', tmp_path / 'flows.html'
+
+    exit_code = cli.main([str(multiple_queries), '--workers', '1', '-o', str(output), '--html', str(html)] + options)
+
+    assert exit_code == cli.EXIT_OK
+    actual = pd.read_csv(output)
+    assert len(actual) == len(expected)
+    assert actual['actual_rows'].tolist() == expected['actual_rows'].tolist()
+    assert html.read_text(encoding='utf-8').count('id="sankey-') == 1
+
+
+def test_plan_files_parquet(multiple_queries, tmp_path, expected):
+    pytest.importorskip('pyarrow')
+
+    exit_code = cli.main([str(multiple_queries / '*.json'), '-q', '-o', str(tmp_path / 'flows.parquet')])
+
+    assert exit_code == cli.EXIT_OK
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / 'flows.parquet'), expected, check_dtype=False)
+
+
+def test_partial_failure(multiple_queries, tmp_path):
+    execution_plan = json.loads(open(multiple_queries / 'q1_execution_plan.json').read())
+    explain_output = [{'Plan': execution_plan, 'Planning Time': 0.1}]
+    (tmp_path / 'explain.json').write_text(json.dumps(explain_output))
+    (tmp_path / 'broken.json').write_text('{"Node Type": ')
+    (tmp_path / 'not_a_plan.json').write_text('{"a": 1}')
+
+    exit_code = cli.main([str(tmp_path / '*.json'), 'no_such_dir/*.json', '-o', str(tmp_path / 'flows.csv')])
+
+    assert exit_code == cli.EXIT_PARTIAL
+    assert len(pd.read_csv(tmp_path / 'flows.csv')) == len(PostgresParser().parse([execution_plan]))
+
+
+def test_failure(multiple_queries, tmp_path):
+    assert cli.main(['no_such_dir/*.json', '-o', str(tmp_path / 'flows.csv')]) == cli.EXIT_FAILURE
+    assert not (tmp_path / 'flows.csv').exists()
+
+    with pytest.raises(SystemExit) as e:
+        cli.main([str(multiple_queries), '--queries', 'queries.sql', '-o', str(tmp_path / 'flows.csv')])
+    assert e.value.code == cli.EXIT_FAILURE
+
+
+def test_parse_failure(multiple_queries, tmp_path, monkeypatch):
+    def parse(self, execution_plans):
+        raise RuntimeError('unexpected')
+
+    monkeypatch.setattr(PostgresParser, 'parse', parse)
+
+    assert cli.main([str(multiple_queries), '-o', str(tmp_path / 'flows.csv')]) == cli.EXIT_FAILURE
+    assert not (tmp_path / 'flows.csv').exists()
+
+
+def test_queries(sqlite_parser, tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, 'parser_factory', lambda *args, **kwargs: sqlite_parser)
+    (tmp_path / 'queries.sql').write_text('select 1;\nselect * from no_such_table;\nselect 1 union all select 2;\n')
+
+    exit_code = cli.main(
+        ['--queries', str(tmp_path / 'queries.sql'), '--con-str', 'sqlite://', '-o', str(tmp_path / 'flows.csv')]
+    )
+
+    assert exit_code == cli.EXIT_PARTIAL
+    assert pd.read_csv(tmp_path / 'flows.csv')['query_hash'].nunique() == 2
+
+
+def test_timings_and_profile(multiple_queries, tmp_path, capsys):
+    output, profile = tmp_path / 'flows.csv', tmp_path / 'run.prof'
+
+    exit_code = cli.main(
+        [str(multiple_queries), '--workers', '1', '-o', str(output), '--timings', '--profile', str(profile)]
+    )
+
+    assert exit_code == cli.EXIT_OK
+    timings = capsys.readouterr().err
+    assert all(stage in timings for stage in ['parse_nodes', 'enrich_stats', 'parse'])
+    assert pstats.Stats(str(profile)).total_calls > 0
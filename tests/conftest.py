@@ -0,0 +1,51 @@
+import json
+import pathlib
+import time
+
+import pytest
+from sqlalchemy import event
+
+from query_flow.parsers.postgres_parser import PostgresParser
+
+
+class SQLiteParser(PostgresParser):
+    """A local stand-in, runs the query and turns SQLite `EXPLAIN QUERY PLAN` output into a Postgres like plan."""
+
+    def get_engine(self, con_str):
+        engine = super().get_engine(con_str)
+        if not event.contains(engine, 'connect', SQLiteParser._register_sleep):
+            event.listen(engine, 'connect', SQLiteParser._register_sleep)
+        return engine
+
+    @staticmethod
+    def _register_sleep(dbapi_connection, connection_record):
+        dbapi_connection.create_function('sleep', 1, time.sleep)
+
+    def _explain_query(self, query, con_str):
+        with self.get_engine(con_str).connect() as con:
+            actual_rows = len(con.execute(query).fetchall())
+            plan_rows = con.execute(f'EXPLAIN QUERY PLAN {query}').fetchall()
+        return {
+            'Node Type': 'Result',
+            'Total Cost': 1.0,
+            'Actual Rows': actual_rows,
+            'Plans': [{'Node Type': 'Result', 'Total Cost': 1.0, 'Alias': row[-1]} for row in plan_rows],
+        }
+
+
+@pytest.fixture
+def sqlite_parser():
+    """A parser explaining queries against SQLite (e.g. `sqlite://`), so no database server is needed."""
+    with SQLiteParser() as parser:
+        yield parser
+
+
+@pytest.fixture
+def multiple_queries():
+    """A directory of Postgres plans, a plan per query, sharing some of their operations."""
+    return pathlib.Path(__file__).parent / 'parsers' / 'data' / 'postgres' / 'multi_parse' / 'multiple_queries'
+
+
+@pytest.fixture
+def execution_plans(multiple_queries):
+    return [json.loads(open(query_f).read()) for query_f in sorted(multiple_queries.glob('*.json'))]
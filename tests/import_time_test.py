@@ -0,0 +1,36 @@
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+# Rendering and querying dependencies are imported on first use
+lazy_packages = frozenset(['sqlalchemy', 'plotly', 'pyathena', 'psycopg2'])
+# Time of the package's own imports, on top of numpy and pandas that the flows are made of
+import_budget_seconds = 0.5
+
+import_script = '''
+import sys, time
+import numpy, pandas
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(*sys.modules)
+'''
+
+
+@pytest.mark.parametrize(
+    'module', ['query_flow.parsers.postgres_parser', 'query_flow.parsers.athena_parser', 'query_flow.profiler']
+)
+def test_import_time(module):
+    output = subprocess.run(
+        [sys.executable, '-c', import_script.format(module=module)],
+        cwd=pathlib.Path(__file__).parents[1],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    seconds, imported_modules = output.split('\n', 1)
+
+    assert float(seconds) < import_budget_seconds
+    assert not {imported_module.split('.')[0] for imported_module in imported_modules.split()} & lazy_packages
@@ -26,3 +26,58 @@
 #     assert_dataframe_almost_acual(
 #         actual_flow_df, expected_flow_df,
 #     )
+
+
+import pathlib
+
+import pandas as pd
+import pytest
+
+from query_flow.parsers.athena_parser import AthenaParser
+
+
+@pytest.mark.parametrize(
+    'plan_path', sorted((pathlib.Path(__file__).parent / 'data' / 'athena' / 'parse').glob('*.json'))
+)
+def test_enrich_stats(plan_path):
+    p = AthenaParser()
+    actual_flow_df = p.parse([p.execution_plan_extractor(plan_path.read_text())])
+
+    for metric in ['nodeOutputRows', 'nodeOutputDataSize', 'nodeCpuTime']:
+        assert actual_flow_df[metric].dtype == float
+        assert actual_flow_df[metric].notna().all()
+        assert (actual_flow_df[metric] >= 0).all()
+    filters = actual_flow_df['operation_type'].isin(p.redundent_operation_names)
+    assert not actual_flow_df.loc[~filters, 'redundent_operation'].any()
+
+
+@pytest.mark.parametrize(
+    'plan_path', sorted((pathlib.Path(__file__).parent / 'data' / 'athena' / 'parse').glob('*.json'))
+)
+def test_execution_plan_extractor(plan_path):
+    p = AthenaParser()
+    execution_plan = p.execution_plan_extractor(plan_path.read_text())
+
+    assert 'fragments' in execution_plan
+    # Rows streamed from the cursor are loaded the same as the whole output
+    assert p.execution_plan_extractor(iter(plan_path.read_text().splitlines())) == execution_plan
+
+
+def test_execution_plan_extractor_is_not_evaluated():
+    with pytest.raises(ValueError):
+        AthenaParser().execution_plan_extractor('Query Plan\n__import__("os").getcwd()')
+
+
+def test_normalize_units_rows():
+    actual = AthenaParser.normalize_units(pd.Series(['17038 rows', '1 row', '0 rows', '7']), AthenaParser.rows_scales)
+
+    assert actual.tolist() == [17038.0, 1.0, 0.0, 7.0]
+
+
+@pytest.mark.parametrize('plan_name', ['execution_plan_5.json', 'execution_plan_8.json'])
+def test_single_row_plans(plan_name):
+    p = AthenaParser()
+    plan_path = pathlib.Path(__file__).parent / 'data' / 'athena' / 'parse' / plan_name
+    actual_flow_df = p.parse([p.execution_plan_extractor(plan_path.read_text())])
+
+    assert actual_flow_df['nodeOutputRows'].tolist() == [1.0] * len(actual_flow_df)
@@ -0,0 +1,36 @@
+import gzip
+import json
+
+import pytest
+
+from query_flow.parsers.auto_explain_log import AutoExplainLog, ingest_auto_explain_log
+from query_flow.parsers.postgres_parser import PostgresParser
+
+
+def write_auto_explain_log(log_path, execution_plans):
+    log_lines = ['2022-08-13 10:00:00.000 UTC [4242] LOG:  database system is ready to accept connections']
+    for execution_plan in execution_plans:
+        plan_text = json.dumps({'Query Text': 'select\n}', 'Plan': execution_plan}, indent=2)
+        log_lines.append('2022-08-13 10:00:01.000 UTC [4243] LOG:  duration: 4194.678 ms  plan:')
+        log_lines.extend(f'\t{plan_line}' for plan_line in plan_text.splitlines())
+        log_lines.append('2022-08-13 10:00:02.000 UTC [4243] LOG:  statement: select 1;')
+    log_text = '\n'.join(log_lines).encode() + b'\n'
+
+    with (gzip.open if log_path.suffix == '.gz' else open)(log_path, 'wb') as log_file:
+        log_file.write(log_text)
+
+
+@pytest.mark.parametrize('log_name', ['postgresql.log', 'postgresql.log.gz'])
+def test_ingest_auto_explain_log(log_name, execution_plans, tmp_path):
+    write_auto_explain_log(tmp_path / log_name, execution_plans * 3)
+
+    log = AutoExplainLog(tmp_path / log_name)
+    assert [json.loads(payload)['Plan'] for payload in log] == execution_plans * 3
+    with (gzip.open if log_name.endswith('.gz') else open)(tmp_path / log_name, 'rb') as log_file:
+        assert log.scanned_bytes == len(log_file.read())
+
+    flow_df, stats = ingest_auto_explain_log(tmp_path / log_name, batch_size=4)
+    assert (stats.plans, stats.skipped_plans) == (6, 0)
+    assert stats.megabytes == log.scanned_bytes / 2 ** 20
+    assert stats.megabytes_per_second > 0
+    assert len(flow_df) == 3 * len(PostgresParser().parse(execution_plans))
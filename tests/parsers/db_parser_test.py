@@ -1,3 +1,6 @@
+import pickle
+
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
@@ -13,11 +16,11 @@ def test_not_compact_get_next_id():
     }
     current_hash = parser._get_hash(**given_new_node)
     actual_new_node = parser._get_next_id(current_hash)
-    assert actual_new_node == parser.max_supported_nodes - 1
+    assert actual_new_node == 0
 
     current_hash = parser._get_hash(**given_new_node)
     actual_existing_node = parser._get_next_id(current_hash)
-    assert actual_existing_node == parser.max_supported_nodes - 2
+    assert actual_existing_node == 1
 
 
 def test_compact_get_next_id():
@@ -28,12 +31,12 @@ def test_compact_get_next_id():
     }
     current_hash = parser._get_hash(**given_new_node)
     actual_new_node = parser._get_next_id(current_hash)
-    assert actual_new_node == parser.max_supported_nodes - 1
+    assert actual_new_node == 0
     assert len(parser.label_to_id_dict) == 1
 
     current_hash = parser._get_hash(**given_new_node)
     actual_existing_node = parser._get_next_id(current_hash)
-    assert actual_existing_node == parser.max_supported_nodes - 1
+    assert actual_existing_node == 0
     assert len(parser.label_to_id_dict) == 1
 
 
@@ -46,3 +49,69 @@ def test_align_source_target_ids():
         {'source': [0, 1, 2, 3], 'target': [1, 2, 4, 2], 'operation_type': ['scan', 'scan', 'scan', 'scan']}
     )
     assert_frame_equal(actual, expected)
+
+
+def test_iter_nodes_deep_plan():
+    parser = PostgresParser()
+    execution_plan = {'Node Type': 'Result', 'Total Cost': 1.0}
+    for _ in range(3000):  # Deeper than the default recursion limit
+        execution_plan = {'Node Type': 'Result', 'Total Cost': 1.0, 'Plans': [execution_plan]}
+
+    parsed_nodes = list(parser.iter_nodes(execution_plan))
+
+    assert len(parsed_nodes) == 3001
+    assert len({parsed_node.query_hash for parsed_node in parsed_nodes}) == 1
+    assert all(child.target == parent.source for parent, child in zip(parsed_nodes, parsed_nodes[1:]))
+
+
+def test_parse_beyond_ten_thousand_nodes():
+    parser = PostgresParser()
+    execution_plans = [
+        {'Node Type': 'Append', 'Total Cost': 1.0, 'Plans': [{'Node Type': 'Result', 'Total Cost': 1.0}] * 6000}
+        for _ in range(2)
+    ]
+
+    flow_df = parser.parse(execution_plans)
+
+    # Ids stay dense and zero based, every plan root gets its own target after the operations
+    assert flow_df['source'].tolist() == list(range(12002))
+    assert sorted(flow_df['target'].value_counts().tolist()) == [1, 1, 6000, 6000]
+    assert flow_df['target'].max() == 12003
+
+
+def test_align_source_target_ids_fragments():
+    given = pd.DataFrame(
+        {
+            'source': [10, 11, 12, 13],
+            'target': [np.nan, 10, np.nan, np.nan],
+            'operation_type': ['Output', 'RemoteSource', 'Project', 'Project'],
+            'label': ['Output', 'remote_source [10, 2]', 'Project', 'Project'],
+            'fragment_id': ['0', '', '10', '2'],
+            'query_hash': 'q',
+        }
+    )
+    actual = DBParser.align_source_target_ids(given)
+    assert actual['target'].tolist() == [4, 0, 1, 1]
+
+
+def test_engines_are_reused_until_closed():
+    with PostgresParser() as parser:
+        engine = parser.get_engine('sqlite://')
+        assert parser.get_engine('sqlite://') is engine
+        assert parser.get_engine('sqlite:///:memory:') is not engine
+        assert len(parser.engines) == 2
+
+    assert parser.engines == {}
+    assert parser.get_engine('sqlite://') is not engine
+
+
+def test_parser_pickles_without_transient_state():
+    parser = PostgresParser(is_compact=True)
+    parser.get_engine('sqlite://')
+    flow_df = parser.parse([{'Node Type': 'Result', 'Total Cost': 1.0}])
+
+    unpickled_parser = pickle.loads(pickle.dumps(parser))
+
+    assert unpickled_parser.engines == {}
+    assert unpickled_parser.is_compact
+    assert_frame_equal(unpickled_parser.parse([{'Node Type': 'Result', 'Total Cost': 1.0}]), flow_df)
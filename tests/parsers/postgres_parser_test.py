@@ -1,3 +1,4 @@
+import copy
 import json
 import pathlib
 
@@ -37,3 +38,137 @@ def test_parse_multi(use_case):
         actual_flow_df,
         expected_flow_df,
     )
+
+
+def flow_edges(flow_df):
+    operation_types = flow_df.drop_duplicates('source').set_index('source')['operation_type']
+    return sorted(zip(flow_df['operation_type'], flow_df['target'].map(operation_types).fillna('')))
+
+
+def assert_flow_equal(left, right, is_compact):
+    """Asserts both flows are equal up to the ids, e.g. a batch parsed serially and across workers."""
+    assert_frame_equal(relabel_ids(left, is_compact), relabel_ids(right, is_compact), check_like=True)
+
+
+def relabel_ids(flow_df, is_compact):
+    """
+    Replaces the ids by keys that don't depend on the order they were allocated in: the node_hash in compact mode
+    (where operations sharing it share their id) and otherwise the node_hash path to the last operator.
+    """
+    node_hashes = dict(zip(flow_df['source'], flow_df['node_hash']))
+    targets = dict(zip(flow_df['source'], flow_df['target']))
+
+    def node_key(node):
+        if is_compact or targets[node] not in node_hashes:
+            return node_hashes[node]
+        return f'{node_hashes[node]}/{node_key(targets[node])}'
+
+    sources = [node_key(source) for source in flow_df['source']]
+    relabeled_flow_df = flow_df.assign(
+        source=sources,
+        target=[
+            node_key(target) if target in node_hashes else f'last operator of {source}'
+            for source, target in zip(sources, flow_df['target'])
+        ],
+    )
+    return relabeled_flow_df.sort_values(by=['query_hash', 'source', 'target'], ignore_index=True)
+
+
+@pytest.mark.parametrize('is_compact', [False, True])
+def test_memoized_parse(is_compact, execution_plans, tmp_path, monkeypatch):
+    expected_flow_df = PostgresParser(is_compact=is_compact).parse(execution_plans)
+
+    actual_flow_df = PostgresParser(is_compact=is_compact, memo_dir=tmp_path).parse(execution_plans)
+    assert_flow_equal(actual_flow_df, expected_flow_df, is_compact)
+
+    # Plans memoized on disk aren't parsed again
+    p = PostgresParser(is_compact=is_compact, memo_dir=tmp_path)
+    monkeypatch.setattr(p, 'iter_nodes', None)
+    assert_frame_equal(p.parse(execution_plans), actual_flow_df)
+
+
+@pytest.mark.parametrize(
+    'parser_kwargs', [{}, {'parse_workers': 2}, {'memoize': True}], ids=['serial', 'parallel', 'memo']
+)
+def test_parse_iterable(parser_kwargs, execution_plans):
+    expected_flow_df = PostgresParser(**parser_kwargs).parse(execution_plans)
+    actual_flow_df = PostgresParser(**parser_kwargs).parse(plan for plan in execution_plans)
+    assert_frame_equal(actual_flow_df, expected_flow_df)
+
+
+def test_memoized_parse_configurations(execution_plans, tmp_path):
+    PostgresParser(memo_dir=tmp_path).parse(execution_plans)
+
+    # Flows memoized by another configuration aren't reused
+    for config in [dict(hash_mode='fast'), dict(compact_dtypes=True)]:
+        actual_flow_df = PostgresParser(memo_dir=tmp_path, **config).parse(execution_plans)
+        assert_frame_equal(actual_flow_df, PostgresParser(memo_dir=tmp_path / 'fresh', **config).parse(execution_plans))
+    assert len(list(tmp_path.glob('*.pkl'))) == 3 * len(execution_plans)
+
+
+@pytest.mark.parametrize('is_compact', [False, True], ids=['non-compact', 'compact'])
+def test_fast_hash_mode(is_compact, execution_plans):
+    expected_flow_df = PostgresParser(is_compact=is_compact).parse(execution_plans)
+    actual_flow_df = PostgresParser(is_compact=is_compact, hash_mode='fast').parse(execution_plans)
+
+    hash_columns = ['node_hash', 'query_hash', 'subtree_hash']
+    assert_frame_equal(actual_flow_df.drop(columns=hash_columns), expected_flow_df.drop(columns=hash_columns[:2]))
+    assert actual_flow_df['query_hash'].nunique() == len(execution_plans)
+
+    # Identical subtrees share their hash across the plans, and the plan hashes are stable across parses
+    plans_per_subtree = actual_flow_df.groupby('subtree_hash')['query_hash'].nunique()
+    assert (plans_per_subtree > 1).any()
+    assert_frame_equal(PostgresParser(is_compact=is_compact, hash_mode='fast').parse(execution_plans), actual_flow_df)
+
+
+@pytest.mark.parametrize('hash_mode', ['sha224', 'fast'])
+def test_query_hash_inner_metrics(hash_mode, execution_plans):
+    # e.g. EXPLAIN re-runs, whose roots keep their estimates while the operations below them change
+    rerun_plan = copy.deepcopy(execution_plans[0])
+    rerun_plan['Plans'][0]['Plans'][0]['Total Cost'] += 1
+
+    flow_df = PostgresParser(hash_mode=hash_mode).parse([execution_plans[0], rerun_plan])
+
+    assert flow_df['query_hash'].nunique() == 2
+
+
+@pytest.mark.parametrize('is_compact', [False, True], ids=['non-compact', 'compact'])
+def test_parallel_parse(is_compact, execution_plans):
+    expected_flow_df = PostgresParser(is_compact=is_compact).parse(execution_plans)
+    actual_flow_df = PostgresParser(is_compact=is_compact, parse_workers=2).parse(execution_plans)
+
+    assert_flow_equal(actual_flow_df, expected_flow_df, is_compact)
+
+
+@pytest.mark.parametrize('is_compact', [False, True], ids=['non-compact', 'compact'])
+def test_add_plans(is_compact, execution_plans):
+    p = PostgresParser(is_compact=is_compact)
+
+    first_flow_df = p.add_plans(execution_plans[:1])
+    new_flow_df = p.add_plans(execution_plans[1:])
+
+    # Only the new rows are returned, and the ids of the rows added before are kept
+    assert set(new_flow_df['query_hash']) == set(p.live_flow_df['query_hash']) - set(first_flow_df['query_hash'])
+    live_first_flow_df = p.live_flow_df[p.live_flow_df['query_hash'].isin(first_flow_df['query_hash'])]
+    assert_frame_equal(live_first_flow_df.reset_index(drop=True), first_flow_df)
+    assert flow_edges(p.live_flow_df) == flow_edges(PostgresParser(is_compact=is_compact).parse(execution_plans))
+    live_ids = set(p.live_flow_df['source']) | set(p.live_flow_df['target'])
+    assert live_ids == set(range(len(live_ids)))
+
+    p.clear_live_flow()
+    assert p.live_flow_df.empty
+
+
+@pytest.mark.parametrize(
+    'parser_kwargs', [{}, {'parse_workers': 2}, {'memoize': True}], ids=['serial', 'parallel', 'memo']
+)
+def test_compact_dtypes(parser_kwargs, execution_plans):
+    expected_flow_df = PostgresParser(**parser_kwargs).parse(execution_plans)
+
+    actual_flow_df = PostgresParser(compact_dtypes=True, **parser_kwargs).parse(execution_plans)
+
+    assert actual_flow_df[['source', 'target', 'actual_rows']].dtypes.tolist() == ['int32'] * 3
+    assert actual_flow_df[['label', 'query_hash']].dtypes.tolist() == ['category'] * 2
+    assert actual_flow_df['estimated_cost'].dtype == 'float32'
+    assert actual_flow_df.memory_usage(deep=True).sum() < expected_flow_df.memory_usage(deep=True).sum()
+    assert_frame_equal(actual_flow_df.astype(expected_flow_df.dtypes), expected_flow_df)
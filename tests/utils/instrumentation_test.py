@@ -0,0 +1,60 @@
+from query_flow.parsers.postgres_parser import PostgresParser
+from query_flow.utils.instrumentation import StageMetrics, measure_stage
+from query_flow.vizualizers.query_report import QueryReport
+from query_flow.vizualizers.query_vizualizer import QueryVizualizer
+
+
+def test_pipeline_stages(execution_plans):
+    metrics = StageMetrics()
+    parser = PostgresParser(instrumentation=metrics)
+
+    flow_df = parser.parse(execution_plans)
+    QueryReport(QueryVizualizer(parser)).add(flow_df, ['actual_rows'], 'flows').to_html()
+
+    summary = metrics.summary()
+    assert summary.index.tolist() == [
+        'parse_nodes',
+        'align_source_target_ids',
+        'enrich_stats',
+        'parse',
+        'level_of_detail',
+        'melt',
+        'colors',
+        'figure',
+        'serialize',
+    ]
+    assert (summary['calls'] == 1).all()
+    assert summary.loc['parse_nodes', 'nodes'] == len(flow_df)
+    assert summary.loc['parse', 'rows'] == len(flow_df)
+    assert summary.loc['enrich_stats', 'memory_mb'] > 0
+    assert summary.loc['parse', 'seconds'] >= summary.loc['enrich_stats', 'seconds']
+
+
+def test_parallel_parse(execution_plans):
+    metrics = StageMetrics()
+    parser = PostgresParser(instrumentation=metrics, parse_workers=2)
+
+    flow_df = parser.parse(execution_plans)
+
+    assert len(flow_df) == len(PostgresParser().parse(execution_plans))
+    assert metrics.summary().index.tolist() == ['parse']
+
+
+def test_query_stages(sqlite_parser):
+    metrics = StageMetrics()
+    sqlite_parser.instrumentation = metrics
+    vizualizer = QueryVizualizer(sqlite_parser)
+    vizualizer.get_flow_df(['select 1', 'select * from no_such_table', 'select 2'], 'sqlite://', max_workers=2)
+
+    # The failing query isn't recorded
+    assert vizualizer.instrumentation is metrics
+    assert metrics.summary().loc['from_query', 'calls'] == 2
+    assert metrics.summary().loc['parse', 'calls'] == 1
+
+
+def test_without_instrumentation():
+    with measure_stage(None, 'parse') as stats:
+        stats['frame'] = None
+
+    assert PostgresParser().instrumentation is None
+    assert StageMetrics().summary().empty
@@ -0,0 +1,32 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from query_flow.utils.misc import calc_precentage, calc_ratio
+
+
+def test_calc_ratio_matches_row_wise_ratio():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'actual_rows': rng.integers(0, 5, 1000), 'plan_rows': rng.integers(0, 5, 1000)})
+
+    def row_wise_ratio(this, other):
+        if this == other:
+            return 1
+        elif this == 0 or other == 0:
+            return np.inf
+        return max(this, other) / min(this, other)
+
+    expected = [row_wise_ratio(this, other) for this, other in zip(df['actual_rows'], df['plan_rows'])]
+    assert calc_ratio(df, 'actual_rows', 'plan_rows').tolist() == expected
+
+
+def test_calc_precentage_zero_totals_without_warnings():
+    series, totals = pd.Series([0.0, 3.0, 1.0], index=[5, 6, 7]), pd.Series([0.0, 0.0, 4.0], index=[5, 6, 7])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        precentage = calc_precentage(series, totals)
+
+    assert precentage.index.tolist() == [5, 6, 7]
+    assert precentage.tolist()[2] == 25.0
+    assert precentage.iloc[:2].isna().all()
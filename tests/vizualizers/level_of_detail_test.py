@@ -0,0 +1,57 @@
+import pytest
+
+from query_flow.parsers.postgres_parser import PostgresParser
+from query_flow.utils.plan_generator import make_postgres_plan
+from query_flow.vizualizers.level_of_detail import collapse_flow_df, collapsed_operation_type, max_label_length
+
+
+def root_rows(flow_df):
+    is_root = ~flow_df['target'].isin(flow_df['source'])
+    return flow_df.loc[is_root, 'actual_rows'].sum()
+
+
+@pytest.fixture(params=[False, True], ids=['detailed', 'compact'])
+def flow_df(request, execution_plans):
+    if not request.param:
+        execution_plans.append(make_postgres_plan(500))
+    return PostgresParser(is_compact=request.param).parse(execution_plans)
+
+
+def test_collapse_flow_df_disabled(flow_df):
+    assert collapse_flow_df(flow_df, 'actual_rows') is flow_df
+
+
+@pytest.mark.parametrize('max_nodes', [1, 10, 50])
+def test_collapse_flow_df_max_nodes(flow_df, max_nodes):
+    actual = collapse_flow_df(flow_df, 'actual_rows', max_nodes=max_nodes)
+
+    assert actual['source'].nunique() <= max_nodes
+    node_ids = set(actual['source']) | set(actual['target'])
+    assert node_ids == set(range(len(node_ids)))
+    assert root_rows(actual) == root_rows(flow_df)
+    assert set(actual['query_hash']) == set(flow_df['query_hash'])
+    assert actual['label'].str.len().max() <= max_label_length
+
+
+def test_collapse_flow_df_collapsed_queries(flow_df):
+    actual = collapse_flow_df(flow_df, 'actual_rows', max_nodes=1)
+
+    assert actual['source'].nunique() == 1
+    assert (actual['operation_type'] == collapsed_operation_type).all()
+    assert actual['label'].unique().tolist() == [f"{flow_df['query_hash'].nunique()} queries"]
+    assert sorted(actual['query_hash']) == sorted(flow_df['query_hash'].unique())
+    assert root_rows(actual) == root_rows(flow_df)
+
+
+def test_collapse_flow_df_min_share():
+    flow_df = PostgresParser().parse([make_postgres_plan(500)])
+
+    actual = collapse_flow_df(flow_df, 'actual_rows', min_share=0.05)
+
+    is_collapsed = actual['operation_type'] == collapsed_operation_type
+    assert 0 < is_collapsed.sum() < len(actual) < len(flow_df)
+    assert actual.loc[is_collapsed, 'label'].str.fullmatch(r'\d+ operations').all()
+    collapsed_operations = actual.loc[is_collapsed, 'label'].str.split().str[0].astype(int).sum()
+    assert collapsed_operations + (~is_collapsed).sum() == len(flow_df)
+    assert root_rows(actual) == root_rows(flow_df)
+    assert (actual['actual_rows'] >= 0).all()
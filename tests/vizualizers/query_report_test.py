@@ -0,0 +1,31 @@
+import json
+import pathlib
+import re
+
+from plotly.offline import get_plotlyjs
+
+from query_flow.parsers.athena_parser import AthenaParser
+from query_flow.vizualizers.query_report import QueryReport
+from query_flow.vizualizers.query_vizualizer import QueryVizualizer
+
+
+def test_write(tmp_path):
+    parser = AthenaParser()
+    report = QueryReport(QueryVizualizer(parser), title='Athena <mocks>')
+    use_case = pathlib.Path(__file__).parents[1] / 'parsers' / 'data' / 'athena' / 'parse'
+    plan_paths = sorted(use_case.glob('*.json'))
+    for plan_path in plan_paths:
+        flow_df = parser.parse([parser.execution_plan_extractor(plan_path.read_text())])
+        for metric in ['nodeOutputRows', 'nodeCpuTime']:
+            report.add(flow_df, [metric], title=plan_path.name)
+
+    report_html = pathlib.Path(report.write(tmp_path / 'report.html')).read_text(encoding='utf-8')
+
+    assert report_html.count(get_plotlyjs()) == 1
+    assert '<title>Athena &lt;mocks&gt;</title>' in report_html
+    assert len(re.findall(r'<div id="sankey-\d+"', report_html)) == 2 * len(plan_paths)
+    figures = json.loads(re.search(r'var figures = (\[.*\]);', report_html, re.DOTALL).group(1))
+    assert [figure['layout']['title'] for figure in figures] == [
+        f'{plan_path.name}-{metric}' for plan_path in plan_paths for metric in ['nodeOutputRows', 'nodeCpuTime']
+    ]
+    assert all(min(figure['data'][0]['link']['value']) >= 1 for figure in figures)
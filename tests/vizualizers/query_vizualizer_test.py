@@ -1,6 +1,97 @@
+import json
+import pathlib
+
+import pandas as pd
 import pytest
 
+from query_flow.parsers.postgres_parser import PostgresParser
+from query_flow.utils.coloring_utils import palette, sample_colors
+from query_flow.vizualizers.query_vizualizer import QueryVizualizer
+
+
+@pytest.fixture
+def vizualizer(sqlite_parser):
+    return QueryVizualizer(sqlite_parser)
+
+
+def test_collect_execution_plans(vizualizer):
+    queries = ['select 1', 'select * from no_such_table', 'select * from sqlite_master', 'select sleep(1)']
+
+    actual = vizualizer.collect_execution_plans(queries, 'sqlite://', max_workers=2, timeout=0.2)
+
+    assert [result.query for result in actual] == queries
+    assert [result.error is None for result in actual] == [True, False, True, False]
+    assert isinstance(actual[3].error, TimeoutError)
+    assert actual[2].execution_plan['Actual Rows'] == 0
+
+
+def test_get_flow_df_concurrently(vizualizer, caplog):
+    queries = ['select 1', 'select * from no_such_table', 'select 1 union all select 2']
+
+    actual = vizualizer.get_flow_df(queries, 'sqlite://', max_workers=4)
+
+    assert actual['query_hash'].nunique() == 2
+    assert [(record.name, record.levelname) for record in caplog.records] == [
+        ('query_flow.vizualizers.query_vizualizer', 'WARNING')
+    ]
+    assert "'select * from no_such_table'" in caplog.text
+    is_root = ~actual['target'].isin(actual['source'])
+    assert sorted(actual.loc[is_root, 'actual_rows']) == [1, 2]
+
+
+def test_enrich_colors(vizualizer):
+    metrics = ['actual_rows', 'cost']
+    df = pd.DataFrame(
+        {
+            'query_hash': ['a', 'a', 'b', 'b', 'b'],
+            'variable': ['actual_rows', 'cost', 'actual_rows', 'cost', 'cost'],
+            'value': [0, 3, 5, 3, 1],
+            'redundent_operation': [False, False, False, False, True],
+            'operation_type': 'Result',
+        }
+    )
+
+    actual = vizualizer._enrich_colors(df.copy(), metrics)
+
+    base_link_colors = sample_colors(2)
+    assert actual['color_link'].tolist() == [
+        'red',
+        palette(base_link_colors[0], 2)[1],
+        palette(base_link_colors[1], 2)[0],
+        palette(base_link_colors[1], 2)[1],
+        'coral',
+    ]
+    assert actual['color_link'].tolist() == vizualizer._enrich_colors(df.copy(), metrics)['color_link'].tolist()
+    assert set(vizualizer._enrich_colors(df[df['query_hash'] == 'b'].copy(), metrics)['color_link']) == {
+        *palette('silver', 2),
+        'coral',
+    }
+
+
+@pytest.mark.parametrize('max_nodes', [None, 6], ids=['all_nodes', 'max_6_nodes'])
+def test_get_figure_compact_dtypes(max_nodes, execution_plans):
+    vizualizer = QueryVizualizer(PostgresParser(), is_colored_nodes=True)
+    expected_flow_df = PostgresParser().parse(execution_plans)
+    expected = vizualizer.get_figure(expected_flow_df, ['actual_rows'], 'flows', max_nodes=max_nodes)
+
+    actual_flow_df = PostgresParser(compact_dtypes=True).parse(execution_plans)
+    actual = vizualizer.get_figure(actual_flow_df, ['actual_rows'], 'flows', max_nodes=max_nodes)
+
+    for trace_key, keys in [('link', ['source', 'target', 'value', 'label', 'color']), ('node', ['label', 'color'])]:
+        for key in keys:
+            assert list(actual['data'][0][trace_key][key]) == list(expected['data'][0][trace_key][key])
+
+
+def test_get_figure_compact_dtypes_query_subset():
+    use_case = pathlib.Path(__file__).parents[1] / 'parsers' / 'data' / 'postgres' / 'parse'
+    queries = [json.loads(open(query_f).read()) for query_f in sorted(use_case.glob('*/execution_plan.json'))]
+    flow_df = PostgresParser(compact_dtypes=True).parse(queries)
+    vizualizer = QueryVizualizer(PostgresParser())
+
+    # The categorical query_hash keeps the categories of the filtered out queries
+    flow_df = flow_df[flow_df['query_hash'] != flow_df['query_hash'].cat.categories[0]]
+    actual = vizualizer.get_figure(flow_df, ['actual_rows'], 'flows')
+    expected = vizualizer.get_figure(flow_df.astype({'query_hash': object}), ['actual_rows'], 'flows')
 
-@pytest.mark.skip(reason='This might change soon')
-def test_enrich_colors():
-    pass
+    assert list(actual['data'][0]['link']['color']) == list(expected['data'][0]['link']['color'])
+    assert len(set(actual['data'][0]['link']['color'])) > 1